@@ -1,13 +1,15 @@
 import os
-import httpx
-from openai import OpenAI
 from fastapi import HTTPException
-from typing import Optional
+from typing import AsyncIterator, List, Optional
 from dotenv import load_dotenv
 import logging
 import traceback
 from pathlib import Path
 
+from deadline import remaining
+from timings import span
+from stream_parser import ItemParser, FLASHCARD_FIELDS, QUIZ_FIELDS
+
 # Load .env variables
 env_path = Path(__file__).parent / '.env'
 load_dotenv(dotenv_path=env_path)
@@ -16,25 +18,116 @@ load_dotenv(dotenv_path=env_path)
 groq_api_key = os.getenv("GROQ_API_KEY") or os.getenv("GROQAPIKEY") or os.getenv("GROQ_APIKEY")
 openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
 openrouter_api_key_gemma = os.getenv("OPENROUTER_API_KEY_GEMMA")
-if not openrouter_api_key:
-    raise ValueError("OPENROUTER_API_KEY environment variable is not set")
 
-# Initialize clients
-groq_client = OpenAI(
-    base_url="https://api.groq.com/openai/v1",
-    api_key=groq_api_key,
-    http_client=httpx.Client(timeout=60.0)
-)
+# Longest we wait on the provider; a request's own deadline can shorten it
+LLM_TIMEOUT = 60.0
+
+# Clients are built on first use: the OpenAI SDK and httpx are slow to import,
+# and importing this module should not require API keys. They are async so that
+# cancelling a request also closes its provider connection.
+_groq_client = None
+_openrouter_client = None
+
+
+def get_groq_client():
+    global _groq_client
+    if _groq_client is None:
+        import httpx
+        from openai import AsyncOpenAI
+
+        _groq_client = AsyncOpenAI(
+            base_url="https://api.groq.com/openai/v1",
+            api_key=groq_api_key,
+            http_client=httpx.AsyncClient(timeout=LLM_TIMEOUT)
+        )
+    return _groq_client
+
+
+def get_openrouter_client():
+    global _openrouter_client
+    if _openrouter_client is None:
+        if not openrouter_api_key:
+            raise ValueError("OPENROUTER_API_KEY environment variable is not set")
+
+        import httpx
+        from openai import AsyncOpenAI
+
+        _openrouter_client = AsyncOpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=openrouter_api_key,
+            http_client=httpx.AsyncClient(timeout=LLM_TIMEOUT)
+        )
+    return _openrouter_client
+
+
+async def close_clients():
+    global _groq_client, _openrouter_client
+    for client in (_groq_client, _openrouter_client):
+        if client is not None:
+            await client.close()
+    _groq_client = _openrouter_client = None
+
 
-openrouter_client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=openrouter_api_key,
-    http_client=httpx.Client(timeout=60.0)
-)
+async def complete(**kwargs):
+    """Create a Groq chat completion within the request's deadline, timed as its "llm" stage."""
+    with span("llm"):
+        return await get_groq_client().chat.completions.create(timeout=remaining(LLM_TIMEOUT), **kwargs)
+
+
+async def stream_completion(**kwargs) -> AsyncIterator[str]:
+    """Yield a streamed Groq completion's text as it arrives.
+
+    Closing the generator early closes the upstream response, so the provider
+    stops generating tokens nobody will read.
+    """
+    with span("llm"):
+        stream = await get_groq_client().chat.completions.create(stream=True, timeout=remaining(LLM_TIMEOUT), **kwargs)
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+
+class StreamedItems:
+    """Items parsed from a streamed completion; ``text`` is the raw completion so far."""
+
+    def __init__(self, request: dict, fields: tuple, limit: int):
+        self.parser = ItemParser(*fields)
+        self._request = request
+        self._limit = limit
+
+    @property
+    def text(self) -> str:
+        return self.parser.text
+
+    async def __aiter__(self):
+        count = 0
+        chunks = stream_completion(**self._request)
+        try:
+            async for text in chunks:
+                for item in self.parser.feed(text):
+                    yield item
+                    count += 1
+                    if count >= self._limit:
+                        # Stop the provider once the requested number of items exists
+                        return
+            for item in self.parser.finish()[:self._limit - count]:
+                yield item
+        finally:
+            await chunks.aclose()
+
+
+async def collect_items(items: StreamedItems) -> str:
+    """Join streamed items back into the plain-text format; raw text if none parsed."""
+    collected = [item async for item in items]
+    return "\n\n".join(collected) if collected else items.text.strip()
 
 
 # 📘 Ask AI Function
-async def ask_ai(question: str, context: Optional[str] = None) -> str:
+async def ask_ai(question: str, context: Optional[str] = None,
+                 history: Optional[List[dict]] = None, summary: Optional[str] = None) -> str:
     try:
         messages = [
             {
@@ -50,15 +143,25 @@ async def ask_ai(question: str, context: Optional[str] = None) -> str:
 
   
 
+        # Static instructions and document context come first so the prompt prefix
+        # stays identical across turns and provider-side prompt caching can hit
         if context:
             messages.append({
                 "role": "system",
                 "content": f"Relevant context from user's documents:\n{context}"
             })
 
+        if summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary}"
+            })
+
+        # Recent turns are sent verbatim, oldest first
+        messages.extend(history or [])
         messages.append({"role": "user", "content": question})
 
-        response = groq_client.chat.completions.create(
+        response = await complete(
             model="llama-3.3-70b-versatile",
             messages=messages,
             max_tokens=4096,
@@ -78,6 +181,47 @@ async def ask_ai(question: str, context: Optional[str] = None) -> str:
         raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
 
+# 🧠 Conversation Summarizer
+async def summarize_conversation(previous_summary: Optional[str], turns: List[dict]) -> str:
+    try:
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        prompt = f"""Update the running summary of a study conversation with the new turns below.
+Keep every fact, question and answer the student may refer back to, drop greetings and filler,
+and stay under 250 words. Reply with the updated summary only.
+
+Current summary:
+{previous_summary or "(none yet)"}
+
+New turns:
+{transcript}"""
+
+        response = await complete(
+            model="llama-3.3-70b-versatile",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You maintain concise, faithful summaries of tutoring conversations."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            max_tokens=400,
+            temperature=0.2,
+        )
+
+        if not response.choices:
+            raise HTTPException(status_code=500, detail="Empty response from AI")
+
+        return response.choices[0].message.content.strip()
+
+    except Exception as e:
+        logging.error(f"Conversation summarization failed: {str(e)}")
+        logging.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Conversation summarization failed: {str(e)}")
+
+
 # 📝 Note Generator
 async def generate_notes(context: str) -> str:
     try:
@@ -96,7 +240,7 @@ Format Guidelines
 Content to generate notes from:
 {context}"""
 
-        response = groq_client.chat.completions.create(
+        response = await complete(
             model="llama-3.3-70b-versatile",
             messages=[
                 {
@@ -133,22 +277,21 @@ Content to generate notes from:
 
 
 # ❓ Quiz Generator
-async def generate_quiz(context: str, options: dict) -> str:
-    try:
-        question_types = []
-        if options.get('question_types', {}).get('trueFalse'):
-            question_types.append("True or False")
-        if options.get('question_types', {}).get('multipleChoice'):
-            question_types.append("Multiple Choice")
-        if options.get('question_types', {}).get('fillInBlank'):
-            question_types.append("Fill in the Blank")
-        if options.get('question_types', {}).get('shortAnswer'):
-            question_types.append("Short Answer")
-
-        if not question_types:
-            raise ValueError("At least one question type must be selected")
-
-        prompt = f"""You are a Quiz Generator AI. Create a quiz based on the following content:
+def _quiz_request(context: str, options: dict) -> dict:
+    question_types = []
+    if options.get('question_types', {}).get('trueFalse'):
+        question_types.append("True or False")
+    if options.get('question_types', {}).get('multipleChoice'):
+        question_types.append("Multiple Choice")
+    if options.get('question_types', {}).get('fillInBlank'):
+        question_types.append("Fill in the Blank")
+    if options.get('question_types', {}).get('shortAnswer'):
+        question_types.append("Short Answer")
+
+    if not question_types:
+        raise ValueError("At least one question type must be selected")
+
+    prompt = f"""You are a Quiz Generator AI. Create a quiz based on the following content:
 
 {context}
 
@@ -176,29 +319,36 @@ Important formatting rules:
 
 Generate a total of {options.get('num_questions', 5)} questions, mixing all the types equally."""
 
-        response = groq_client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert at creating educational quizzes that test understanding and knowledge."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            extra_headers={
-                "HTTP-Referer": "http://localhost:3000",
-                "X-Title": "Study Buddy",
+    return dict(
+        model="llama3-70b-8192",
+        messages=[
+            {
+                "role": "system",
+                "content": "You are an expert at creating educational quizzes that test understanding and knowledge."
             },
-            extra_body={}
-        )
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        extra_headers={
+            "HTTP-Referer": "http://localhost:3000",
+            "X-Title": "Study Buddy",
+        },
+        extra_body={}
+    )
 
-        if not response.choices:
-            raise HTTPException(status_code=500, detail="Empty response from AI")
 
-        quiz_content = response.choices[0].message.content.strip()
+def stream_quiz(context: str, options: dict) -> StreamedItems:
+    """Yield each question as soon as it is complete, stopping at ``num_questions``."""
+    return StreamedItems(_quiz_request(context, options), QUIZ_FIELDS, int(options.get('num_questions', 5)))
+
+
+async def generate_quiz(context: str, options: dict) -> str:
+    try:
+        quiz_content = await collect_items(stream_quiz(context, options))
+        if not quiz_content:
+            raise HTTPException(status_code=500, detail="Empty response from AI")
         return format_markdown(quiz_content)
 
     except Exception as e:
@@ -217,9 +367,8 @@ def format_markdown(text: str) -> str:
     return text
 
 
-async def generate_flashcards(context: str, num_flashcards: int = 5) -> str:
-    try:
-        prompt = f"""You are a Flashcard Generator AI. Create flashcards based on the following content:
+def _flashcards_request(context: str, num_flashcards: int) -> dict:
+    prompt = f"""You are a Flashcard Generator AI. Create flashcards based on the following content:
 
 {context}
 
@@ -241,34 +390,41 @@ Make sure the flashcards are:
 - Easy to understand
 - Suitable for memorization"""
 
-        response = groq_client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert at creating educational flashcards that help with memorization and understanding."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            max_tokens=2000,
-            temperature=0.7,
-            top_p=0.9,
-            frequency_penalty=0.3,
-            presence_penalty=0.3,
-            extra_headers={
-                "HTTP-Referer": "http://localhost:3000",
-                "X-Title": "Study Buddy",
+    return dict(
+        model="llama3-70b-8192",
+        messages=[
+            {
+                "role": "system",
+                "content": "You are an expert at creating educational flashcards that help with memorization and understanding."
             },
-            extra_body={}
-        )
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        max_tokens=2000,
+        temperature=0.7,
+        top_p=0.9,
+        frequency_penalty=0.3,
+        presence_penalty=0.3,
+        extra_headers={
+            "HTTP-Referer": "http://localhost:3000",
+            "X-Title": "Study Buddy",
+        },
+        extra_body={}
+    )
+
+
+def stream_flashcards(context: str, num_flashcards: int = 5) -> StreamedItems:
+    """Yield each flashcard as soon as it is complete, stopping at ``num_flashcards``."""
+    return StreamedItems(_flashcards_request(context, num_flashcards), FLASHCARD_FIELDS, int(num_flashcards))
 
-        if not response.choices:
-            raise HTTPException(status_code=500, detail="Empty response from AI")
 
-        flashcards = response.choices[0].message.content.strip()
+async def generate_flashcards(context: str, num_flashcards: int = 5) -> str:
+    try:
+        flashcards = await collect_items(stream_flashcards(context, num_flashcards))
+        if not flashcards:
+            raise HTTPException(status_code=500, detail="Empty response from AI")
         return flashcards
 
     except Exception as e:
@@ -0,0 +1,136 @@
+"""Compare PDF extraction backends on throughput and text fidelity.
+
+Run from the backend directory:
+
+    python benchmarks/extract_benchmark.py                 # synthetic sample corpus
+    python benchmarks/extract_benchmark.py --corpus DIR    # your own PDFs
+
+A corpus directory holds ``*.pdf`` files; a ``<name>.txt`` next to a PDF is
+used as its reference text for the fidelity score. Without a reference only
+throughput is reported for that file.
+"""
+import argparse
+import random
+import sys
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pdf_processor import available_backends, extract_pages  # noqa: E402
+
+WORDS = (
+    "cell membrane protein energy photosynthesis molecule theorem proof integral "
+    "derivative function variable history revolution economy market supply demand "
+    "algorithm complexity graph network memory process thread language grammar"
+).split()
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_sample_pdf(pages: list) -> bytes:
+    """Write a minimal PDF whose pages contain the given lines of Helvetica text."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_refs = []
+    for lines in pages:
+        stream = "BT /F1 11 Tf 14 TL 72 760 Td " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream.encode("latin-1")))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_refs)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def sample_corpus(documents: int = 5, pages: int = 20, seed: int = 7) -> list:
+    """Synthetic (name, pdf_bytes, reference_text) triples with known content."""
+    rng = random.Random(seed)
+    corpus = []
+    for doc in range(documents):
+        doc_pages = [
+            [" ".join(rng.choice(WORDS) for _ in range(10)) for _ in range(40)]
+            for _ in range(pages)
+        ]
+        reference = " ".join(line for lines in doc_pages for line in lines)
+        corpus.append((f"sample-{doc}.pdf", build_sample_pdf(doc_pages), reference))
+    return corpus
+
+
+def load_corpus(directory: Path) -> list:
+    corpus = []
+    for pdf in sorted(directory.glob("*.pdf")):
+        reference = pdf.with_suffix(".txt")
+        corpus.append((pdf.name, pdf.read_bytes(), reference.read_text() if reference.exists() else None))
+    return corpus
+
+
+def fidelity(reference: str, extracted: str) -> float:
+    return SequenceMatcher(None, reference.split(), extracted.split(), autojunk=False).ratio()
+
+
+def run(corpus: list, backends: list, repeat: int) -> None:
+    print(f"{'backend':<10} {'pages':>7} {'seconds':>9} {'pages/s':>9} {'fidelity':>9} {'errors':>7}")
+    for backend in backends:
+        total_pages = 0
+        elapsed = 0.0
+        scores = []
+        errors = 0
+        for _, data, reference in corpus:
+            try:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    pages = extract_pages(data, backend)
+                elapsed += time.perf_counter() - start
+            except Exception:
+                errors += 1
+                continue
+            total_pages += len(pages) * repeat
+            if reference is not None:
+                scores.append(fidelity(reference, " ".join(pages)))
+
+        rate = total_pages / elapsed if elapsed else 0.0
+        score = f"{sum(scores) / len(scores):.3f}" if scores else "n/a"
+        print(f"{backend:<10} {total_pages:>7} {elapsed:>9.3f} {rate:>9.1f} {score:>9} {errors:>7}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, help="directory of PDFs (default: synthetic sample corpus)")
+    parser.add_argument("--backends", help="comma separated backends (default: all installed)")
+    parser.add_argument("--repeat", type=int, default=3, help="extractions per document")
+    args = parser.parse_args()
+
+    backends = args.backends.split(",") if args.backends else available_backends()
+    if not backends:
+        sys.exit("No PDF extraction backend is installed")
+
+    corpus = load_corpus(args.corpus) if args.corpus else sample_corpus()
+    if not corpus:
+        sys.exit(f"No PDFs found in {args.corpus}")
+    run(corpus, backends, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Compare chat_messages layouts: random UUID keys vs time-ordered IDs clustered by space.
+
+Run from the backend directory:
+
+    python benchmarks/id_benchmark.py --messages 200000 --spaces 500
+
+Messages are inserted round-robin across spaces, as concurrent conversations
+would be. Reports insert throughput, database size and the time to read one
+space's history in order.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ids import new_id  # noqa: E402
+
+LEGACY_TABLE = """
+    CREATE TABLE chat_messages (
+        id TEXT PRIMARY KEY,
+        space_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+LEGACY_INDEX = "CREATE INDEX idx_chat_messages_space ON chat_messages(space_id, timestamp)"
+LEGACY_HISTORY = "SELECT role, content FROM chat_messages WHERE space_id = ? ORDER BY timestamp ASC, rowid ASC"
+CLUSTERED_HISTORY = "SELECT role, content FROM chat_messages WHERE space_id = ? ORDER BY id ASC"
+INSERT = "INSERT INTO chat_messages (id, space_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)"
+BATCH = 1000
+
+
+def run(path: str, schema: list, make_id, history_sql: str, spaces: list, messages: int) -> dict:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for statement in schema:
+        conn.execute(statement)
+    conn.commit()
+
+    start = time.perf_counter()
+    for first in range(0, messages, BATCH):
+        conn.executemany(INSERT, [
+            (make_id(), spaces[n % len(spaces)], "user", f"message {n} " + "x" * 150, datetime.now())
+            for n in range(first, min(first + BATCH, messages))
+        ])
+        conn.commit()
+    insert_seconds = time.perf_counter() - start
+
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size = conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+    conn.close()
+
+    # Cold-ish reads: a fresh connection per run, random spaces
+    conn = sqlite3.connect(path)
+    sample = random.Random(0).sample(spaces, min(100, len(spaces)))
+    start = time.perf_counter()
+    for space_id in sample:
+        conn.execute(history_sql, (space_id,)).fetchall()
+    history_seconds = (time.perf_counter() - start) / len(sample)
+    conn.close()
+    return {"insert": insert_seconds, "size": size, "history": history_seconds}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--spaces", type=int, default=500)
+    args = parser.parse_args()
+
+    spaces = [str(uuid.uuid4()) for _ in range(args.spaces)]
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["STUDYBUDDY_DATA_DIR"] = data_dir
+        from database import CHAT_MESSAGES_TABLE
+
+        legacy = run(os.path.join(data_dir, "legacy.db"), [LEGACY_TABLE, LEGACY_INDEX],
+                     lambda: str(uuid.uuid4()), LEGACY_HISTORY, spaces, args.messages)
+        clustered = run(os.path.join(data_dir, "clustered.db"), [CHAT_MESSAGES_TABLE.format(name="chat_messages")],
+                        new_id, CLUSTERED_HISTORY, spaces, args.messages)
+
+    for name, result in (("uuid4 + index", legacy), ("ulid clustered", clustered)):
+        print(f"{name:15} {args.messages / result['insert']:9.0f} inserts/s  "
+              f"{result['size'] / 2**20:7.1f} MiB  {result['history'] * 1000:6.2f} ms/history")
+    print(f"{'improvement':15} {legacy['insert'] / clustered['insert']:8.1f}x inserts  "
+          f"{legacy['size'] / clustered['size']:6.1f}x size  {legacy['history'] / clustered['history']:6.1f}x history")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Track the cold-start cost of importing the app against a time budget.
+
+Run from the backend directory:
+
+    python benchmarks/import_benchmark.py              # median of 5 cold imports
+    python benchmarks/import_benchmark.py --top 15     # also list the slowest modules
+
+Each run imports ``main`` in a fresh interpreter, which is what every worker
+spawn and reload pays. The script exits non-zero when the median exceeds
+``--budget-ms`` (default: the IMPORT_BUDGET_MS environment variable, or 300).
+Importing must not need API keys, a database or network access.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+PROBE = (
+    "import sys, time; sys.path.insert(0, {backend!r}); "
+    "start = time.perf_counter(); import main; "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+
+def _clean_env() -> dict:
+    env = dict(os.environ)
+    for key in ("OPENROUTER_API_KEY", "OPENROUTER_API_KEY_GEMMA", "GROQ_API_KEY"):
+        env.pop(key, None)
+    return env
+
+
+def measure(runs: int) -> list:
+    """Milliseconds to import main, one fresh interpreter per run."""
+    timings = []
+    probe = PROBE.format(backend=str(BACKEND_DIR))
+    # Run from an empty directory so a stray .env or database cannot mask import-time work
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(runs):
+            result = subprocess.run(
+                [sys.executable, "-c", probe],
+                cwd=workdir, env=_clean_env(), capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                sys.exit(f"Importing main failed:\n{result.stderr}")
+            timings.append(float(result.stdout.strip().splitlines()[-1]))
+            if any(Path(workdir).iterdir()):
+                sys.exit(f"Importing main created files: {sorted(p.name for p in Path(workdir).iterdir())}")
+    return timings
+
+
+def slowest_modules(top: int) -> list:
+    """(cumulative_ms, module) pairs from ``python -X importtime``."""
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import sys; sys.path.insert(0, {str(BACKEND_DIR)!r}); import main"],
+            cwd=workdir, env=_clean_env(), capture_output=True, text=True,
+        )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, module = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        rows.append((int(cumulative_us) / 1000, module))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "300")))
+    parser.add_argument("--top", type=int, default=0, help="show the N slowest modules")
+    args = parser.parse_args()
+
+    timings = measure(args.runs)
+    median = statistics.median(timings)
+    print(f"import main: median {median:.1f} ms, min {min(timings):.1f} ms over {args.runs} runs "
+          f"(budget {args.budget_ms:.0f} ms)")
+
+    if args.top:
+        for cumulative_ms, module in slowest_modules(args.top):
+            print(f"  {cumulative_ms:8.1f} ms  {module}")
+
+    if median > args.budget_ms:
+        sys.exit(f"Import time {median:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
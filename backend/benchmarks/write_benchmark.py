@@ -0,0 +1,86 @@
+"""Compare chat-message insert throughput: one commit per message vs the write queue.
+
+Run from the backend directory:
+
+    python benchmarks/write_benchmark.py --messages 2000 --concurrency 64
+
+Uses a throwaway database in a temporary directory. Both modes fsync on commit
+(synchronous=FULL), so the numbers compare durable writes.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+INSERT = "INSERT INTO chat_messages (id, space_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)"
+
+
+def _params(space_id: str, n: int) -> tuple:
+    return (str(uuid.uuid4()), space_id, "user", f"message {n} " + "x" * 200, datetime.now())
+
+
+async def per_message_commits(database, space_id: str, messages: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def insert(n: int):
+        conn = database.connect("FULL")
+        try:
+            conn.execute(INSERT, _params(space_id, n))
+            conn.commit()
+        finally:
+            conn.close()
+
+    async def one(n: int):
+        async with semaphore:
+            await asyncio.to_thread(insert, n)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(messages)))
+    return time.perf_counter() - start
+
+
+async def queued_commits(write_queue, space_id: str, messages: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(n: int):
+        async with semaphore:
+            await write_queue.write(INSERT, _params(space_id, n))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(messages)))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["STUDYBUDDY_DATA_DIR"] = data_dir
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+        import database
+        from write_queue import write_queue
+
+        database.init_db()
+        space_id = str(uuid.uuid4())
+
+        baseline = asyncio.run(per_message_commits(database, space_id, args.messages, args.concurrency))
+        queued = asyncio.run(queued_commits(write_queue, space_id, args.messages, args.concurrency))
+        stats = write_queue.stats()
+        write_queue.close()
+
+    print(f"per-message commits: {args.messages / baseline:9.0f} msg/s ({baseline:.2f} s)")
+    print(f"write queue:         {args.messages / queued:9.0f} msg/s ({queued:.2f} s), "
+          f"{stats['batches']} commits, avg batch {stats['avg_batch']:.1f}")
+    print(f"speedup:             {baseline / queued:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
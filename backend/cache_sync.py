@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, List, Set
+
+from database import connect, get_db
+
+# In-process caches are kept coherent across workers through the cache_invalidations
+# table: writers append (scope, key) rows and every worker replays rows it has not seen.
+
+# Minimum seconds between polls of the invalidation log; 0 polls on every cache read
+POLL_INTERVAL = float(os.getenv("CACHE_SYNC_INTERVAL", "0"))
+# Log rows older than this are pruned; a worker lagging further behind drops its caches
+RETENTION_SECONDS = int(os.getenv("CACHE_SYNC_RETENTION", "3600"))
+# Seconds between prunes by the leader worker
+PRUNE_INTERVAL = float(os.getenv("CACHE_SYNC_PRUNE_INTERVAL", "300"))
+
+_handlers: Dict[str, List[Callable[[str], None]]] = {}
+_clear_handlers: List[Callable[[], None]] = []
+_last_seen = None
+_last_poll = 0.0
+_lock = threading.Lock()
+# Rows this worker published and already applied; skipped when replayed
+_published: Set[int] = set()
+# Long-lived connection for polls from cache reads that have no connection of their own
+_poll_conn = None
+
+
+def register(scope: str, handler: Callable[[str], None]):
+    """Call ``handler(key)`` whenever any worker invalidates ``scope``/``key``."""
+    _handlers.setdefault(scope, []).append(handler)
+
+
+def register_clear(handler: Callable[[], None]):
+    """Call ``handler()`` when this worker has missed invalidations and must start cold."""
+    _clear_handlers.append(handler)
+
+
+def _apply(scope: str, key: str):
+    for handler in _handlers.get(scope, []):
+        handler(key)
+
+
+def invalidate(scope: str, key: str, conn=None, local: bool = True):
+    """Publish an invalidation to every worker and apply it locally right away.
+
+    Pass ``conn`` to publish inside the caller's transaction (the caller commits).
+    Pass ``local=False`` when this worker has already updated its caches in place
+    and only the other workers need to drop their copies.
+    """
+    if conn is not None:
+        conn.execute("INSERT INTO cache_invalidations (scope, key) VALUES (?, ?)", (scope, key))
+    else:
+        with get_db() as own_conn:
+            cursor = own_conn.execute("INSERT INTO cache_invalidations (scope, key) VALUES (?, ?)", (scope, key))
+            own_conn.commit()
+        with _lock:
+            _published.add(cursor.lastrowid)
+    if local:
+        _apply(scope, key)
+
+
+def sync(conn=None):
+    """Replay invalidations published by other workers since the last poll."""
+    global _last_seen, _last_poll, _poll_conn
+    now = time.monotonic()
+    if POLL_INTERVAL and now - _last_poll < POLL_INTERVAL:
+        return
+
+    with _lock:
+        if conn is None:
+            if _poll_conn is None:
+                _poll_conn = connect()
+            conn = _poll_conn
+        _last_poll = now
+        if _last_seen is None:
+            # A fresh worker has empty caches, so only newer invalidations matter
+            row = conn.execute("SELECT MAX(id) FROM cache_invalidations").fetchone()
+            _last_seen = row[0] or 0
+            return
+
+        rows = conn.execute(
+            "SELECT id, scope, key FROM cache_invalidations WHERE id > ? ORDER BY id",
+            (_last_seen,)
+        ).fetchall()
+        if rows and rows[0]["id"] > _last_seen + 1:
+            oldest = conn.execute("SELECT MIN(id) FROM cache_invalidations").fetchone()[0]
+            if oldest is not None and oldest > _last_seen + 1:
+                logging.warning("Missed pruned cache invalidations; dropping local caches")
+                for handler in _clear_handlers:
+                    handler()
+
+        for row in rows:
+            if row["id"] in _published:
+                _published.discard(row["id"])
+                continue
+            _apply(row["scope"], row["key"])
+        if rows:
+            _last_seen = rows[-1]["id"]
+
+
+def prune():
+    with get_db() as conn:
+        conn.execute(
+            "DELETE FROM cache_invalidations WHERE created_at < datetime('now', ?)",
+            (f"-{RETENTION_SECONDS} seconds",)
+        )
+        conn.commit()
+
+
+async def keep_pruned():
+    """Prune the invalidation log every PRUNE_INTERVAL seconds; run by the leader only."""
+    while True:
+        try:
+            await asyncio.to_thread(prune)
+        except Exception as e:
+            logging.error(f"Failed to prune cache invalidations: {str(e)}")
+        await asyncio.sleep(PRUNE_INTERVAL)
@@ -0,0 +1,143 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import cache_sync
+from ingest import get_file_text
+
+# Upper bound on the text held across all cached bundles
+MAX_BYTES = int(os.getenv("CONTEXT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Separator the client uses when it joins file contents itself
+FILE_SEPARATOR = "\n\n---\n\n"
+
+
+class ContextCache:
+    """LRU of prompt-ready document context per space, bounded by total size."""
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # space_id -> (folder_id, file_ids, context)
+        self._lock = threading.Lock()
+
+    def get(self, space_id: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(space_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(space_id)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, space_id: str, folder_id: str, file_ids: list, context: str):
+        size = len(context)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(space_id)
+            self._entries[space_id] = (folder_id, frozenset(file_ids), context)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def _discard(self, space_id: str):
+        entry = self._entries.pop(space_id, None)
+        if entry is not None:
+            self.size -= len(entry[2])
+
+    def invalidate_space(self, space_id: str):
+        with self._lock:
+            self._discard(space_id)
+
+    def invalidate_folder(self, folder_id: str):
+        with self._lock:
+            for space_id in [key for key, entry in self._entries.items() if entry[0] == folder_id]:
+                self._discard(space_id)
+
+    def invalidate_file(self, file_id: str):
+        with self._lock:
+            for space_id in [key for key, entry in self._entries.items() if file_id in entry[1]]:
+                self._discard(space_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+context_cache = ContextCache()
+cache_sync.register("space", context_cache.invalidate_space)
+cache_sync.register("folder", context_cache.invalidate_folder)
+# Files added to a folder change the context of its spaces that use every file
+cache_sync.register("resources", context_cache.invalidate_folder)
+cache_sync.register("file", context_cache.invalidate_file)
+cache_sync.register_clear(context_cache.clear)
+
+
+def space_file_ids(conn, space_id: str) -> Optional[tuple]:
+    """(folder_id, file_ids) for a space: its selected files, else every file in its folder."""
+    space = conn.execute("SELECT folder_id FROM spaces WHERE id = ?", (space_id,)).fetchone()
+    if not space:
+        return None
+
+    selected = conn.execute(
+        "SELECT file_id FROM space_files WHERE space_id = ? ORDER BY position",
+        (space_id,)
+    ).fetchall()
+    if selected:
+        return space["folder_id"], [row["file_id"] for row in selected]
+
+    files = conn.execute(
+        "SELECT id FROM files WHERE folder_id = ? ORDER BY name, id",
+        (space["folder_id"],)
+    ).fetchall()
+    return space["folder_id"], [row["id"] for row in files]
+
+
+def get_space_context(conn, space_id: str) -> Optional[str]:
+    """Prompt-ready context for a space, built once and then served from memory.
+
+    The text is assembled in a fixed file order so that consecutive turns send
+    a byte-identical prompt prefix. Bundles that include files still being
+    processed are rebuilt on every call until ingest finishes.
+    """
+    cache_sync.sync(conn)
+    context = context_cache.get(space_id)
+    if context is not None:
+        return context
+
+    resolved = space_file_ids(conn, space_id)
+    if resolved is None:
+        return None
+    folder_id, file_ids = resolved
+
+    contents = []
+    complete = True
+    for file_id in file_ids:
+        file = get_file_text(conn, file_id)
+        if not file:
+            continue
+        if file["status"] == "processing":
+            complete = False
+        if file["content"]:
+            contents.append(file["content"])
+
+    context = FILE_SEPARATOR.join(contents)
+    if complete:
+        context_cache.put(space_id, folder_id, file_ids, context)
+    return context
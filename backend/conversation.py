@@ -0,0 +1,101 @@
+import os
+import logging
+from typing import List, Optional, Set, Tuple
+
+from database import get_db
+from ai_service import summarize_conversation
+
+# Most recent messages always sent verbatim
+RECENT_MESSAGES = int(os.getenv("CHAT_RECENT_MESSAGES", "6"))
+# Older messages are folded into the summary once this many have piled up
+SUMMARY_BATCH = int(os.getenv("CHAT_SUMMARY_BATCH", "6"))
+# Cap on verbatim turns, so the prompt stays bounded even while folds keep failing
+MAX_HISTORY_MESSAGES = RECENT_MESSAGES + SUMMARY_BATCH
+
+# chat_messages roles mapped onto chat-completion roles; 'system' notes are not replayed
+_ROLES = {"user": "user", "ai": "assistant", "assistant": "assistant"}
+
+# Spaces with a fold in flight in this worker; another turn does not start a second one
+_folding: Set[str] = set()
+
+
+def _unsummarized(conn, space_id: str) -> Tuple[Optional[str], int, List[dict]]:
+    space = conn.execute(
+        "SELECT summary, summarized_count FROM spaces WHERE id = ?",
+        (space_id,)
+    ).fetchone()
+    if not space:
+        return None, 0, []
+
+    messages = conn.execute(
+        """
+        SELECT role, content FROM chat_messages
+        WHERE space_id = ?
+        ORDER BY id ASC
+        LIMIT -1 OFFSET ?
+        """,
+        (space_id, space["summarized_count"])
+    ).fetchall()
+    return space["summary"], space["summarized_count"], [dict(message) for message in messages]
+
+
+def load_memory(conn, space_id: str, current_message: Optional[str] = None) -> Tuple[Optional[str], List[dict], bool]:
+    """Return (summary, recent turns, needs_fold) for building a chat prompt.
+
+    The client stores the user's message before calling /chat, so a trailing
+    user turn matching ``current_message`` is left out of the history.
+    """
+    summary, _, messages = _unsummarized(conn, space_id)
+    if messages and current_message is not None and messages[-1]["role"] == "user" \
+            and messages[-1]["content"] == current_message:
+        messages = messages[:-1]
+
+    needs_fold = len(messages) - RECENT_MESSAGES >= SUMMARY_BATCH and space_id not in _folding
+    history = [
+        {"role": _ROLES[message["role"]], "content": message["content"]}
+        for message in messages[-MAX_HISTORY_MESSAGES:] if message["role"] in _ROLES
+    ]
+    return summary, history, needs_fold
+
+
+async def fold_conversation(space_id: str):
+    """Fold the messages older than the recent window into the space's rolling summary."""
+    if space_id in _folding:
+        return
+    _folding.add(space_id)
+    try:
+        await _fold(space_id)
+    finally:
+        _folding.discard(space_id)
+
+
+async def _fold(space_id: str):
+    with get_db() as conn:
+        summary, summarized_count, messages = _unsummarized(conn, space_id)
+
+    older = messages[:-RECENT_MESSAGES] if RECENT_MESSAGES else messages
+    if len(older) < SUMMARY_BATCH:
+        return
+
+    turns = [
+        {"role": _ROLES[message["role"]], "content": message["content"]}
+        for message in older if message["role"] in _ROLES
+    ]
+    try:
+        new_summary = await summarize_conversation(summary, turns)
+    except Exception as e:
+        logging.error(f"Failed to fold conversation for space {space_id}: {str(e)}")
+        return
+
+    with get_db() as conn:
+        # Only apply if no concurrent fold or history reset happened meanwhile
+        conn.execute(
+            "UPDATE spaces SET summary = ?, summarized_count = ? WHERE id = ? AND summarized_count = ?",
+            (new_summary, summarized_count + len(older), space_id, summarized_count)
+        )
+        conn.commit()
+
+
+def reset_memory(conn, space_id: str):
+    """Forget the rolling summary; the caller commits."""
+    conn.execute("UPDATE spaces SET summary = NULL, summarized_count = 0 WHERE id = ?", (space_id,))
@@ -1,59 +1,316 @@
+import os
+import time
 import sqlite3
 import logging
+import traceback
 from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
-DB_PATH = Path(__file__).parent / "study_buddy.db"
+import deadline
+from timings import span
+from ids import IdGenerator
 
-def init_db():
-    with get_db() as conn:
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS folders (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                user_id TEXT NOT NULL
-            )
-        """)
-        
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS spaces (
-                id TEXT PRIMARY KEY,
-                type TEXT NOT NULL,
-                name TEXT NOT NULL,
-                folder_id TEXT NOT NULL,
-                notes TEXT,
-                FOREIGN KEY (folder_id) REFERENCES folders (id)
-            )
-        """)
-        
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS resources (
-                id TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                folder_id TEXT NOT NULL,
-                content TEXT,
-                FOREIGN KEY (folder_id) REFERENCES folders (id)
-            )
-        """)
-
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS chat_messages (
-                id TEXT PRIMARY KEY,
-                space_id TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp DATETIME NOT NULL,
-                FOREIGN KEY (space_id) REFERENCES spaces (id)
-            )
-        """)
-        
-        conn.commit()
+try:
+    import fcntl
+except ImportError:  # Windows: single-worker deployments only
+    fcntl = None
 
-@contextmanager
-def get_db():   
-    conn = sqlite3.connect(str(DB_PATH))
+# Database setup: absolute paths so every worker uses the same files whatever its cwd
+DATA_DIR = Path(os.getenv("STUDYBUDDY_DATA_DIR", Path(__file__).resolve().parent)).resolve()
+DB_PATH = Path(os.getenv("STUDYBUDDY_DB_PATH", DATA_DIR / "studybuddy.db")).resolve()
+LOCK_PATH = DB_PATH.with_name(DB_PATH.name + ".migrate.lock")
+LEADER_LOCK_PATH = DB_PATH.with_name(DB_PATH.name + ".leader.lock")
+# How long a connection waits for another worker's write lock before failing
+BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "30"))
+
+# SQLite VM instructions between deadline checks on request connections
+DEADLINE_CHECK_STEPS = 10000
+
+# Messages are stored clustered by space and then by time-ordered ID, so reading a
+# conversation's history is one contiguous range scan of the primary key
+CHAT_MESSAGES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id TEXT NOT NULL,
+        space_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (space_id, id),
+        FOREIGN KEY (space_id) REFERENCES spaces(id)
+    ) WITHOUT ROWID
+'''
+
+# Bump whenever init_db's schema changes so running databases are migrated
+SCHEMA_VERSION = 3
+
+class TimedCursor(sqlite3.Cursor):
+    # Rows are produced lazily, so fetching is charged to "db" as well as executing
+    def execute(self, *args):
+        with span("db"):
+            return super().execute(*args)
+
+    def executemany(self, *args):
+        with span("db"):
+            return super().executemany(*args)
+
+    def fetchone(self):
+        with span("db"):
+            return super().fetchone()
+
+    def fetchmany(self, *args, **kwargs):
+        with span("db"):
+            return super().fetchmany(*args, **kwargs)
+
+    def fetchall(self):
+        with span("db"):
+            return super().fetchall()
+
+    def __next__(self):
+        with span("db"):
+            return super().__next__()
+
+class TimedConnection(sqlite3.Connection):
+    # Statement, fetch and commit time is charged to the current request's "db" stage
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        with span("db"):
+            return super().commit()
+
+def connect(synchronous: str = "NORMAL") -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, check_same_thread=False, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
+    # WAL makes NORMAL durable against application crashes and avoids an fsync per commit
+    conn.execute(f"PRAGMA synchronous={synchronous}")
+    return conn
+
+@contextmanager
+def get_db():
+    conn = None
     try:
+        conn = connect()
+        at = deadline.current()
+        if at is not None:
+            # Abort long queries once the request is abandoned (raises OperationalError "interrupted")
+            conn.set_progress_handler(lambda: time.time() >= at, DEADLINE_CHECK_STEPS)
         yield conn
     finally:
-        conn.close() 
\ No newline at end of file
+        if conn:
+            conn.close()
+
+@contextmanager
+def file_lock(path: Path, blocking: bool = True):
+    """Hold an exclusive lock on ``path`` shared by every process on the host.
+
+    With ``blocking=False`` this yields False instead of waiting when another
+    process holds the lock, and True once it is held.
+    """
+    with open(path, "a") as handle:
+        if fcntl:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+        try:
+            yield True
+        finally:
+            if fcntl:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+_leader_handle = None
+
+def acquire_leader_lock() -> bool:
+    """Try to become the one worker that runs singleton background duties.
+
+    The lock is held for the life of the process and released by the OS when
+    it exits, so a replacement worker can take over.
+    """
+    global _leader_handle
+    if _leader_handle is not None:
+        return True
+    if not fcntl:
+        return True
+
+    handle = open(LEADER_LOCK_PATH, "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _leader_handle = handle
+    return True
+
+def add_column(conn, table: str, column: str, definition: str):
+    columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def init_db():
+    try:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+
+        # Every worker runs this at startup; the lock lets exactly one of them migrate
+        with file_lock(LOCK_PATH), get_db() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                logging.info("Database schema is up to date")
+                return
+
+            # WAL lets readers see committed pages while an ingest is still writing
+            conn.execute("PRAGMA journal_mode=WAL")
+            create_schema(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.commit()
+            logging.info("Database initialized successfully")
+    except Exception as e:
+        logging.error(f"Database initialization error: {str(e)}")
+        logging.error(traceback.format_exc())
+        raise
+
+def create_schema(conn):
+    """Create or upgrade every table; each statement is idempotent."""
+    # Create tables if they don't exist
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS folders (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            user_id TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            folder_id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            FOREIGN KEY (folder_id) REFERENCES folders(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS spaces (
+            id TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            name TEXT NOT NULL,
+            folder_id TEXT NOT NULL,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (folder_id) REFERENCES folders(id)
+        )
+    ''')
+    conn.execute(CHAT_MESSAGES_TABLE.format(name="chat_messages"))
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS file_pages (
+            file_id TEXT NOT NULL,
+            page_number INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            PRIMARY KEY (file_id, page_number),
+            FOREIGN KEY (file_id) REFERENCES files(id)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS file_signatures (
+            file_id TEXT PRIMARY KEY,
+            folder_id TEXT NOT NULL,
+            signature BLOB NOT NULL,
+            FOREIGN KEY (file_id) REFERENCES files(id)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS lsh_buckets (
+            folder_id TEXT NOT NULL,
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            PRIMARY KEY (folder_id, band, bucket, file_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_lsh_buckets_file ON lsh_buckets(file_id)")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS space_files (
+            space_id TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (space_id, file_id),
+            FOREIGN KEY (space_id) REFERENCES spaces(id),
+            FOREIGN KEY (file_id) REFERENCES files(id)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_invalidations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS generated_artifacts (
+            content_hash TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            options_key TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (content_hash, kind, options_key),
+            FOREIGN KEY (file_id) REFERENCES files(id)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_generated_artifacts_file ON generated_artifacts(file_id)")
+
+    # Columns added after the initial schema
+    add_column(conn, "files", "status", "TEXT NOT NULL DEFAULT 'ready'")
+    add_column(conn, "files", "page_count", "INTEGER")
+    add_column(conn, "files", "pages_done", "INTEGER NOT NULL DEFAULT 0")
+    add_column(conn, "files", "error", "TEXT")
+    add_column(conn, "files", "duplicate_of", "TEXT")
+    add_column(conn, "spaces", "summary", "TEXT")
+    add_column(conn, "spaces", "summarized_count", "INTEGER NOT NULL DEFAULT 0")
+
+    cluster_chat_messages(conn)
+
+def cluster_chat_messages(conn):
+    """Rebuild a chat_messages table from before clustering, keyed by (space_id, time-ordered id).
+
+    Existing messages get new IDs derived from their timestamps, so ordering by
+    ID matches the order they were written in.
+    """
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'chat_messages'").fetchone()[0]
+    if "WITHOUT ROWID" in sql.upper():
+        return
+
+    logging.info("Migrating chat_messages to time-ordered IDs clustered by space")
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute("DROP INDEX IF EXISTS idx_chat_messages_space")
+    conn.execute(CHAT_MESSAGES_TABLE.format(name="chat_messages_clustered"))
+    generate = IdGenerator()
+    rows = conn.execute("SELECT space_id, role, content, timestamp FROM chat_messages ORDER BY timestamp, rowid")
+    conn.executemany(
+        "INSERT INTO chat_messages_clustered (id, space_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+        (
+            (generate(_timestamp_ms(row["timestamp"])), row["space_id"], row["role"], row["content"], row["timestamp"])
+            for row in rows
+        )
+    )
+    conn.execute("DROP TABLE chat_messages")
+    conn.execute("ALTER TABLE chat_messages_clustered RENAME TO chat_messages")
+
+def _timestamp_ms(value) -> Optional[int]:
+    try:
+        return int(datetime.fromisoformat(str(value)).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import contextvars
+from contextlib import suppress
+from typing import Optional
+
+# Seconds a request may take before it is abandoned; clients may ask for less
+# with an X-Request-Timeout header (seconds)
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+# Bulk uploads and imports process whole batches inside the request
+UPLOAD_DEADLINE = float(os.getenv("UPLOAD_DEADLINE_SECONDS", "600"))
+UPLOAD_PATHS = ("/upload", "/import")
+
+
+class _Deadline:
+    # Shared by every task spawned while handling the request, so clearing it
+    # once the response starts frees background work from the request's deadline
+    __slots__ = ("at",)
+
+    def __init__(self, at: Optional[float]):
+        self.at = at
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+
+
+def current() -> Optional[float]:
+    """The active deadline as a ``time.time()`` timestamp, or None outside a request.
+
+    Wall-clock time so the value can be handed to extraction worker processes.
+    """
+    deadline = _current.get()
+    return deadline.at if deadline is not None else None
+
+
+def expired(at: Optional[float]) -> bool:
+    return at is not None and time.time() >= at
+
+
+def check(at: Optional[float] = None):
+    """Raise TimeoutError if ``at`` (default: the current deadline) has passed."""
+    if expired(at if at is not None else current()):
+        raise TimeoutError("Request deadline exceeded")
+
+
+def remaining(default: float) -> float:
+    """Seconds left before the deadline, capped at ``default``; raises once it has passed."""
+    at = current()
+    if at is None:
+        return default
+    check(at)
+    return min(default, at - time.time())
+
+
+class DeadlineMiddleware:
+    """Cancel a request's handler when its client disconnects or its deadline passes.
+
+    Cancellation propagates into whatever the handler is awaiting, so in-flight
+    provider calls are closed instead of running to completion for nobody.
+    Once the response has started, streaming responses and background tasks
+    are left to run.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    def seconds_for(scope) -> float:
+        seconds = UPLOAD_DEADLINE if scope["path"].startswith(UPLOAD_PATHS) else REQUEST_DEADLINE
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-timeout":
+                with suppress(ValueError):
+                    seconds = min(seconds, max(0.0, float(value)))
+        return seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        seconds = self.seconds_for(scope)
+        deadline = _Deadline(time.time() + seconds)
+        body_received = asyncio.Event()
+        response_started = False
+
+        async def receive_body():
+            message = await receive()
+            if message["type"] != "http.request" or not message.get("more_body", False):
+                body_received.set()
+            return message
+
+        async def send_response(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+                deadline.at = None
+            await send(message)
+
+        async def wait_for_disconnect():
+            # Only once the handler has the whole body, so no request data is consumed here
+            await body_received.wait()
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        token = _current.set(deadline)
+        try:
+            handler = asyncio.ensure_future(self.app(scope, receive_body, send_response))
+        finally:
+            _current.reset(token)
+        watcher = asyncio.ensure_future(wait_for_disconnect())
+        try:
+            done, _ = await asyncio.wait({handler, watcher}, timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+            if handler in done or response_started:
+                watcher.cancel()
+                await handler
+                return
+
+            handler.cancel()
+            with suppress(asyncio.CancelledError):
+                await handler
+        finally:
+            watcher.cancel()
+            deadline.at = None
+
+        if watcher in done:
+            logging.info(f"Client disconnected; cancelled {scope['method']} {scope['path']}")
+            return
+
+        logging.warning(f"Request deadline of {seconds:g}s exceeded; cancelled {scope['method']} {scope['path']}")
+        body = json.dumps({"detail": "Request deadline exceeded"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,170 @@
+import os
+import re
+import zlib
+import random
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 64 hash permutations split into 16 bands of 4 rows: files sharing any band bucket
+# become candidates, which catches pairs with Jaccard similarity above roughly 0.5
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 5
+# Candidates at or above this estimated similarity are reported as near-duplicates
+SIMILARITY_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(0x5EED)  # fixed seed: signatures must stay comparable across runs
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+# The permutations as uint64 columns, split so every product fits in 64 bits
+_A = np.array([a for a, _ in _PERMUTATIONS], dtype=np.uint64)[:, None]
+_A_LO = _A & np.uint64(0xFFFFFFFF)
+_A_HI = _A >> np.uint64(32)
+_B = np.array([b for _, b in _PERMUTATIONS], dtype=np.uint64)[:, None]
+_P = np.uint64(_PRIME)
+# Shingles hashed per step; bounds the (NUM_PERM x chunk) temporaries to a few MB
+_CHUNK = 8192
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text: str) -> set:
+    """CRC32 hashes of the overlapping word n-grams of the normalized text."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {zlib.crc32(" ".join(words).encode())} if words else set()
+    return {
+        zlib.crc32(" ".join(words[i:i + SHINGLE_WORDS]).encode())
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    }
+
+
+def _fold(values: np.ndarray) -> np.ndarray:
+    # One reduction step modulo the Mersenne prime 2**61 - 1, since 2**61 = 1 (mod P)
+    return (values & _P) + (values >> np.uint64(61))
+
+
+def _permute(x: np.ndarray) -> np.ndarray:
+    """(a * x + b) % _PRIME for every permutation and every 32-bit hash x, exactly.
+
+    a * x needs up to 93 bits, so a is split at bit 32: a_lo * x fits in 64
+    bits, and a_hi * x * 2**32 is reduced by splitting a_hi * x at bit 29.
+    """
+    low = _fold(_A_LO * x)
+    high = _A_HI * x
+    total = low + (high >> np.uint64(29)) + ((high & np.uint64((1 << 29) - 1)) << np.uint64(32)) + _B
+    total = _fold(total)
+    return np.where(total >= _P, total - _P, total)
+
+
+def minhash_signature(text: str) -> Optional[bytes]:
+    """MinHash signature of the text as packed uint32s, or None for empty text.
+
+    Vectorised, but bit-for-bit the signature of the original per-shingle
+    loop, so signatures stored earlier stay comparable.
+    """
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    x = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    minimum = np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(x), _CHUNK):
+        np.minimum(minimum, _permute(x[start:start + _CHUNK]).min(axis=1), out=minimum)
+    return (minimum & np.uint64(_MAX_HASH)).astype(np.uint32).tobytes()
+
+
+def similarity(signature_a: bytes, signature_b: bytes) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    a = array("I", signature_a)
+    b = array("I", signature_b)
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+def band_buckets(signature: bytes) -> List[Tuple[int, int]]:
+    """(band, bucket) keys for the LSH index."""
+    values = array("I", signature)
+    return [
+        (band, zlib.crc32(values[band * ROWS:(band + 1) * ROWS].tobytes()))
+        for band in range(BANDS)
+    ]
+
+
+def store_signature(conn, file_id: str, folder_id: str, signature: Optional[bytes]):
+    """Index a file's signature; the caller commits."""
+    if signature is None:
+        return
+    conn.execute(
+        "INSERT OR REPLACE INTO file_signatures (file_id, folder_id, signature) VALUES (?, ?, ?)",
+        (file_id, folder_id, signature)
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO lsh_buckets (folder_id, band, bucket, file_id) VALUES (?, ?, ?, ?)",
+        [(folder_id, band, bucket, file_id) for band, bucket in band_buckets(signature)]
+    )
+
+
+def find_near_duplicates(conn, folder_id: str, signature: Optional[bytes],
+                         exclude: Iterable[str] = ()) -> List[dict]:
+    """Files in the folder whose estimated similarity meets the threshold, best first."""
+    if signature is None:
+        return []
+
+    # One primary-key probe per band; a row-value IN degrades to a folder scan
+    keys = band_buckets(signature)
+    probes = " UNION ".join(
+        "SELECT file_id FROM lsh_buckets WHERE folder_id = ? AND band = ? AND bucket = ?" for _ in keys
+    )
+    candidates = conn.execute(
+        f"SELECT file_id, signature FROM file_signatures WHERE file_id IN ({probes})",
+        [value for band, bucket in keys for value in (folder_id, band, bucket)]
+    ).fetchall()
+
+    excluded = set(exclude)
+    matches = []
+    for candidate in candidates:
+        if candidate["file_id"] in excluded:
+            continue
+        score = similarity(signature, candidate["signature"])
+        if score >= SIMILARITY_THRESHOLD:
+            matches.append({"file_id": candidate["file_id"], "similarity": score})
+    return sorted(matches, key=lambda match: match["similarity"], reverse=True)
+
+
+def delete_signatures(conn, file_id: Optional[str] = None, folder_id: Optional[str] = None):
+    """Drop index rows for one file or for a whole folder; the caller commits.
+
+    Rows are matched on the index tables themselves, not through ``files``, so
+    rows whose file row is already gone are removed too.
+    """
+    column, value = ("file_id", file_id) if file_id is not None else ("folder_id", folder_id)
+    conn.execute(f"DELETE FROM lsh_buckets WHERE {column} = ?", (value,))
+    conn.execute(f"DELETE FROM file_signatures WHERE {column} = ?", (value,))
+
+
+def unique_file_ids(conn, file_ids: List[str]) -> List[str]:
+    """Drop files that are near-duplicates of one listed earlier, keeping the order."""
+    placeholders = ", ".join("?" for _ in file_ids)
+    signatures = {
+        row["file_id"]: row["signature"]
+        for row in conn.execute(
+            f"SELECT file_id, signature FROM file_signatures WHERE file_id IN ({placeholders})",
+            file_ids
+        )
+    }
+
+    kept = []
+    for file_id in file_ids:
+        signature = signatures.get(file_id)
+        if signature is not None and any(
+            signatures.get(other) is not None
+            and similarity(signature, signatures[other]) >= SIMILARITY_THRESHOLD
+            for other in kept
+        ):
+            continue
+        kept.append(file_id)
+    return kept
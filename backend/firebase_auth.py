@@ -1,12 +1,207 @@
-import firebase_admin
-from firebase_admin import credentials, auth
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from fastapi import Depends, Header, HTTPException
+
+# Google's public certificates for Firebase ID tokens, rotated every few hours
+FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+SERVICE_ACCOUNT_PATH = Path(os.getenv(
+    "FIREBASE_SERVICE_ACCOUNT",
+    Path(__file__).resolve().parent / "firebase_service_account.json"
+))
+# Entries beyond this are evicted, expired ones first
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+# Refresh certificates this long before Google says they go stale
+CERT_REFRESH_MARGIN = 300
+CLOCK_SKEW_SECONDS = 10
+# Firebase UIDs allowed to use the admin endpoints; empty disables them
+ADMIN_UIDS = {uid.strip() for uid in os.getenv("ADMIN_UIDS", "").split(",") if uid.strip()}
+
+
+def get_project_id() -> Optional[str]:
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    if project_id:
+        return project_id
+    try:
+        return json.loads(SERVICE_ACCOUNT_PATH.read_text()).get("project_id")
+    except (OSError, ValueError):
+        return None
+
+
+def fetch_google_certificates() -> Tuple[Dict[str, str], int]:
+    """Download the signing certificates and their max-age in seconds."""
+    import httpx
+
+    response = httpx.get(FIREBASE_CERTS_URL, timeout=10.0)
+    response.raise_for_status()
+    max_age = 3600
+    for directive in response.headers.get("cache-control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name == "max-age" and value.isdigit():
+            max_age = int(value)
+    return response.json(), max_age
+
+
+class CertificateStore:
+    """Signing certificates keyed by ``kid``, refreshed before they expire.
+
+    ``fetch`` returns ``(certificates, max_age_seconds)``; tests can pass one that
+    serves locally generated keys.
+    """
+
+    def __init__(self, fetch: Callable[[], Tuple[Dict[str, str], int]] = fetch_google_certificates):
+        self._fetch = fetch
+        self._certificates: Dict[str, str] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Dict[str, str]:
+        if time.time() >= self._expires_at:
+            self.refresh()
+        return self._certificates
+
+    def refresh(self):
+        with self._lock:
+            certificates, max_age = self._fetch()
+            self._certificates = certificates
+            self._fetched_at = time.time()
+            self._expires_at = self._fetched_at + max_age
+
+    def refresh_for_unknown_key(self):
+        # Rate limited so tokens with made-up key IDs cannot hammer Google
+        if time.time() - self._fetched_at >= 60:
+            self.refresh()
+
+    def seconds_until_refresh(self) -> float:
+        return max(60.0, self._expires_at - time.time() - CERT_REFRESH_MARGIN)
+
+    async def keep_warm(self):
+        """Refresh in the background so no request pays for the certificate download."""
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logging.error(f"Failed to refresh Firebase certificates: {str(e)}")
+            await asyncio.sleep(self.seconds_until_refresh())
+
+
+class TokenCache:
+    """Decoded ID tokens keyed by the token's SHA-256, kept until their ``exp``."""
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(id_token: str) -> str:
+        return hashlib.sha256(id_token.encode()).hexdigest()
+
+    def get(self, id_token: str) -> Optional[dict]:
+        key = self.key(id_token)
+        claims = self._entries.get(key)
+        if claims is None:
+            return None
+        if claims["exp"] <= time.time():
+            self._entries.pop(key, None)
+            return None
+        return claims
+
+    def put(self, id_token: str, claims: dict):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                now = time.time()
+                for key in [key for key, entry in self._entries.items() if entry["exp"] <= now]:
+                    del self._entries[key]
+                while len(self._entries) >= self.max_size:
+                    del self._entries[next(iter(self._entries))]
+            self._entries[self.key(id_token)] = claims
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+certificate_store = CertificateStore()
+token_cache = TokenCache()
+
+
+def decode_id_token(id_token: str, project_id: str, certificates: Dict[str, str]) -> dict:
+    """Verify a Firebase ID token's signature and claims, raising ValueError if invalid.
+
+    Performs the same checks as ``firebase_admin.auth.verify_id_token`` without
+    revocation checking.
+    """
+    from google.auth import jwt
+
+    if not project_id:
+        raise ValueError("Firebase project ID is not configured")
+    claims = jwt.decode(
+        id_token,
+        certs=certificates,
+        audience=project_id,
+        clock_skew_in_seconds=CLOCK_SKEW_SECONDS,
+    )
+    if claims.get("iss") != f"https://securetoken.google.com/{project_id}":
+        raise ValueError("Token has an incorrect issuer")
+    if not claims.get("sub") or len(claims["sub"]) > 128:
+        raise ValueError("Token has an invalid subject")
+    if claims.get("auth_time", 0) > time.time() + CLOCK_SKEW_SECONDS:
+        raise ValueError("Token auth_time is in the future")
+    claims["uid"] = claims["sub"]
+    return claims
 
-cred = credentials.Certificate("backend/firebase_service_account.json")
-firebase_admin.initialize_app(cred)
 
 def verify_firebase_token(id_token):
     try:
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = token_cache.get(id_token)
+        if decoded_token is None:
+            from google.auth import jwt
+
+            certificates = certificate_store.get()
+            if jwt.decode_header(id_token).get("kid") not in certificates:
+                # Google may have rotated keys since the last refresh
+                certificate_store.refresh_for_unknown_key()
+                certificates = certificate_store.get()
+            decoded_token = decode_id_token(id_token, get_project_id(), certificates)
+            token_cache.put(id_token, decoded_token)
         return decoded_token
     except Exception as e:
-        return None
\ No newline at end of file
+        return None
+
+
+async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
+    """FastAPI dependency returning the caller's decoded Firebase ID token.
+
+    Cached tokens are served without leaving the event loop; new ones are
+    verified in a worker thread.
+    """
+    scheme, _, id_token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not id_token:
+        raise HTTPException(401, "Missing bearer token")
+
+    decoded_token = token_cache.get(id_token)
+    if decoded_token is None:
+        decoded_token = await asyncio.to_thread(verify_firebase_token, id_token)
+    if decoded_token is None:
+        raise HTTPException(401, "Invalid or expired token")
+    return decoded_token
+
+
+def is_admin(claims: dict) -> bool:
+    return claims.get("uid") in ADMIN_UIDS
+
+
+async def require_admin(user: dict = Depends(get_current_user)) -> dict:
+    """FastAPI dependency for admin-only endpoints."""
+    if not is_admin(user):
+        raise HTTPException(403, "Admin access required")
+    return user
@@ -0,0 +1,50 @@
+import os
+import time
+import threading
+from typing import Optional
+
+# ULIDs: 48-bit millisecond timestamp + 80 random bits, as 26 Crockford base32
+# characters. They sort by creation time, so new rows are appended to the end of
+# primary-key B-trees instead of landing on random pages.
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+
+
+class IdGenerator:
+    """Monotonic ULID generator.
+
+    IDs made within the same millisecond increment the random part, so IDs from
+    one generator are strictly increasing even when generated faster than the
+    clock ticks.
+    """
+
+    def __init__(self):
+        self._last_ms = -1
+        self._last_random = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, ms: Optional[int] = None) -> str:
+        """Return the next ID, stamped with ``ms`` (default: now) since the Unix epoch."""
+        if ms is None:
+            ms = time.time_ns() // 1_000_000
+        with self._lock:
+            if ms <= self._last_ms:
+                ms = self._last_ms
+                random = self._last_random + 1
+                if random >> _RANDOM_BITS:
+                    ms, random = ms + 1, 0
+            else:
+                random = int.from_bytes(os.urandom(10), "big")
+            self._last_ms, self._last_random = ms, random
+        return encode((ms << _RANDOM_BITS) | random)
+
+
+def encode(value: int) -> str:
+    chars = []
+    for _ in range(26):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+new_id = IdGenerator()
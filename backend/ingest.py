@@ -0,0 +1,213 @@
+import os
+import asyncio
+import logging
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional
+
+from database import get_db, file_lock, DATA_DIR
+from pdf_processor import extract_text_from_pdf, iter_pages, NO_READABLE_CONTENT
+from dedup import minhash_signature, store_signature, find_near_duplicates
+
+# Uploaded PDFs are spooled here until extraction finishes, so work survives restarts
+SPOOL_DIR = Path(os.getenv("INGEST_SPOOL_DIR", DATA_DIR / "ingest_spool"))
+# Pages are committed in small batches so readers see progress without one fsync per page
+COMMIT_EVERY_PAGES = int(os.getenv("INGEST_COMMIT_EVERY_PAGES", "5"))
+
+_extraction_pool = None
+# Crash retries each get a process of their own; at most this many at once
+_isolated_slots = asyncio.Semaphore(os.cpu_count() or 1)
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    # PDF parsing is CPU bound, so it runs in worker processes rather than threads
+    global _extraction_pool
+    if _extraction_pool is None:
+        _extraction_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _extraction_pool
+
+
+def shutdown_extraction_pool():
+    global _extraction_pool
+    if _extraction_pool is not None:
+        _extraction_pool.shutdown(wait=False, cancel_futures=True)
+        _extraction_pool = None
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    # Only the first caller to see a pool break replaces it
+    global _extraction_pool
+    if _extraction_pool is pool:
+        logging.error("Extraction worker process crashed; replacing the pool")
+        _extraction_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_extraction(fn, *args):
+    """Run ``fn(*args)`` in the extraction pool, surviving worker crashes.
+
+    A native backend crashing on one bad PDF breaks the whole pool and fails
+    every task in flight. The pool is then replaced, and each of those tasks is
+    retried once in a process of its own, so only the file that crashes it
+    again fails (with BrokenProcessPool).
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+    try:
+        return await loop.run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+
+    async with _isolated_slots:
+        isolated = ProcessPoolExecutor(max_workers=1)
+        try:
+            return await loop.run_in_executor(isolated, fn, *args)
+        finally:
+            isolated.shutdown(wait=False, cancel_futures=True)
+
+
+def spool_path(file_id: str) -> Path:
+    return SPOOL_DIR / f"{file_id}.pdf"
+
+
+def lock_path(file_id: str) -> Path:
+    return SPOOL_DIR / f"{file_id}.lock"
+
+
+def spool_upload(file_id: str, file_bytes: bytes):
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    spool_path(file_id).write_bytes(file_bytes)
+
+
+def ingest_file(file_id: str):
+    """Extract a spooled PDF page by page, committing pages as they are read.
+
+    Runs in a worker process. Resumes after the last committed page, then
+    assembles the full text into ``files.content`` and marks the file ready.
+    A file is ingested by one process at a time: a new leader resumes every
+    file still processing, including ones live workers are ingesting, so runs
+    that cannot take the file's lock skip it.
+    """
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    with file_lock(lock_path(file_id), blocking=False) as claimed:
+        if not claimed:
+            logging.info(f"File {file_id} is already being ingested by another process")
+            return
+        _ingest_file(file_id)
+        lock_path(file_id).unlink(missing_ok=True)
+
+
+def _ingest_file(file_id: str):
+    path = spool_path(file_id)
+    try:
+        with get_db() as conn:
+            row = conn.execute("SELECT folder_id, pages_done, status FROM files WHERE id = ?", (file_id,)).fetchone()
+            if not row:
+                logging.info(f"File {file_id} was deleted before ingest finished")
+                path.unlink(missing_ok=True)
+                return
+            if row["status"] != "processing":
+                # Another process finished it between our resume check and taking the lock
+                logging.info(f"File {file_id} was already ingested")
+                return
+
+            file_bytes = path.read_bytes()
+
+            pending = 0
+            for index, page_count, text in iter_pages(file_bytes, start=row["pages_done"]):
+                conn.execute(
+                    "INSERT OR REPLACE INTO file_pages (file_id, page_number, content) VALUES (?, ?, ?)",
+                    (file_id, index, text)
+                )
+                conn.execute(
+                    "UPDATE files SET pages_done = ?, page_count = ? WHERE id = ?",
+                    (index + 1, page_count, file_id)
+                )
+                pending += 1
+                if pending >= COMMIT_EVERY_PAGES:
+                    conn.commit()
+                    pending = 0
+
+            content = " ".join(
+                page["content"] for page in conn.execute(
+                    "SELECT content FROM file_pages WHERE file_id = ? ORDER BY page_number",
+                    (file_id,)
+                ) if page["content"].strip()
+            )
+            if content:
+                signature = minhash_signature(content)
+                duplicates = find_near_duplicates(conn, row["folder_id"], signature, exclude=[file_id])
+                cursor = conn.execute(
+                    "UPDATE files SET content = ?, status = 'ready', page_count = pages_done, duplicate_of = ? WHERE id = ?",
+                    (content, duplicates[0]["file_id"] if duplicates else None, file_id)
+                )
+                # A file deleted while it was processing must not leave index rows behind
+                if cursor.rowcount == 1:
+                    store_signature(conn, file_id, row["folder_id"], signature)
+            else:
+                conn.execute(
+                    "UPDATE files SET status = 'failed', error = ? WHERE id = ?",
+                    (NO_READABLE_CONTENT, file_id)
+                )
+            # Pages are only needed while the file is processing (or was deleted meanwhile)
+            conn.execute("DELETE FROM file_pages WHERE file_id = ?", (file_id,))
+            conn.commit()
+        path.unlink(missing_ok=True)
+        logging.info(f"File ingested successfully: {file_id}")
+    except Exception as e:
+        logging.error(f"Ingest failed for {file_id}: {str(e)}")
+        logging.error(traceback.format_exc())
+        mark_failed(file_id, str(e))
+        path.unlink(missing_ok=True)
+
+
+def extract_document(file_bytes: bytes, deadline: Optional[float] = None) -> tuple:
+    """Extract text and its MinHash signature in one worker-process round trip."""
+    text = extract_text_from_pdf(file_bytes, deadline=deadline)
+    return text, minhash_signature(text)
+
+
+def mark_failed(file_id: str, error: str):
+    with get_db() as conn:
+        # Never overwrite a file another process has finished meanwhile
+        conn.execute(
+            "UPDATE files SET status = 'failed', error = ? WHERE id = ? AND status = 'processing'",
+            (error, file_id)
+        )
+        conn.commit()
+
+
+def pending_ingests() -> list:
+    """IDs of files left in 'processing' by a previous run; those without a spool file are failed."""
+    with get_db() as conn:
+        rows = conn.execute("SELECT id FROM files WHERE status = 'processing'").fetchall()
+
+    resumable = []
+    for row in rows:
+        if spool_path(row["id"]).exists():
+            resumable.append(row["id"])
+        else:
+            mark_failed(row["id"], "Upload was interrupted before it could be processed")
+    return resumable
+
+
+def get_file_text(conn, file_id: str) -> Optional[dict]:
+    """Return the file's status and text, using the pages extracted so far while processing."""
+    file = conn.execute(
+        "SELECT id, name, content, status, page_count, pages_done, error, duplicate_of FROM files WHERE id = ?",
+        (file_id,)
+    ).fetchone()
+    if not file:
+        return None
+
+    result = dict(file)
+    if file["status"] == "processing":
+        result["content"] = " ".join(
+            page["content"] for page in conn.execute(
+                "SELECT content FROM file_pages WHERE file_id = ? ORDER BY page_number",
+                (file_id,)
+            ) if page["content"].strip()
+        )
+    return result
@@ -1,16 +1,36 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Body, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Body, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from ai_service import ask_ai, generate_notes, generate_quiz, generate_flashcards
+from fastapi.responses import FileResponse, StreamingResponse
+from ai_service import ask_ai, generate_notes, generate_quiz, generate_flashcards, stream_quiz, stream_flashcards, close_clients
+from stream_parser import FLASHCARD_FIELDS, parse_item, split_items
 import os
+import json
 import logging
+import asyncio
+import zipfile
 from io import BytesIO
-from PyPDF2 import PdfReader
+from pdf_processor import NO_READABLE_CONTENT, PDF_PROCESSING_ERROR
 from pydantic import BaseModel
 from models import Folder, AIRequest, NotesRequest, Space, ChatMessage
-import uuid
 from dotenv import load_dotenv
 import sqlite3
-from contextlib import contextmanager
+from contextlib import asynccontextmanager
+from database import get_db, init_db, acquire_leader_lock
+from ids import new_id
+from transfer import iter_records, iter_ndjson, iter_zip, open_import, import_records
+from ingest import run_extraction, shutdown_extraction_pool, spool_upload, spool_path, ingest_file, extract_document, pending_ingests, mark_failed, get_file_text
+from concurrent.futures.process import BrokenProcessPool
+from deadline import DeadlineMiddleware, current as current_deadline
+from firebase_auth import certificate_store, get_current_user, get_project_id, require_admin
+from profiling import TimingMiddleware, TimedJSONResponse, recent_slow_requests, profile_window, list_profiles, profile_path
+from timings import span
+from write_queue import write_queue
+from cache_sync import invalidate, keep_pruned as keep_invalidations_pruned
+from context_cache import context_cache, get_space_context, space_file_ids
+from tree_cache import tree_cache, get_folders as cached_folders, get_space as cached_space, get_resources as cached_resources
+from conversation import load_memory, fold_conversation, reset_memory
+import pregenerate
+from dedup import SIMILARITY_THRESHOLD, similarity, store_signature, find_near_duplicates, delete_signatures, unique_file_ids
 import traceback
 from typing import List, Optional
 from datetime import datetime
@@ -20,105 +40,85 @@ logging.basicConfig(level=logging.INFO)
 # Initialize environment variables
 load_dotenv()
 
-# Database setup
-DB_PATH = 'studybuddy.db'
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup work lives here rather than at import time so that importing the
+    # app (workers, reloads, tools, tests) stays cheap and side-effect free
+    init_db()
+
+    # Keep Firebase signing certificates fresh so token checks never wait on Google
+    cert_refresher = asyncio.create_task(certificate_store.keep_warm()) if get_project_id() else None
+
+    # With several workers, only one resumes interrupted uploads and prunes shared state
+    pruner = None
+    if acquire_leader_lock():
+        pruner = asyncio.create_task(keep_invalidations_pruned())
+        for file_id in pending_ingests():
+            logging.info(f"Resuming ingest of file: {file_id}")
+            asyncio.create_task(run_ingest(file_id))
+
+    yield
+
+    if cert_refresher:
+        cert_refresher.cancel()
+    if pruner:
+        pruner.cancel()
+    pregenerate.stop()
+    # Commit any queued writes before the process exits
+    write_queue.close()
+    shutdown_extraction_pool()
+    await close_clients()
+
+# REQUIRE_AUTH=1 requires a valid Firebase ID token (Authorization: Bearer ...) on every endpoint
+REQUIRE_AUTH = os.getenv("REQUIRE_AUTH", "").lower() in ("1", "true", "yes")
+
+app = FastAPI(
+    lifespan=lifespan,
+    dependencies=[Depends(get_current_user)] if REQUIRE_AUTH else [],
+    default_response_class=TimedJSONResponse
+)
 
-@contextmanager
-def get_db():
-    try:
-        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        yield conn
-    finally:
-        if conn:
-            conn.close()
+# Interactive AI endpoints; background pre-generation yields while any of these are running
+AI_PATHS = ("/ask", "/chat", "/generate-")
 
-def init_db():
+@app.middleware("http")
+async def track_ai_requests(request: Request, call_next):
+    if not request.url.path.startswith(AI_PATHS):
+        return await call_next(request)
+    pregenerate.active_requests += 1
     try:
-        # Ensure the database file exists
-        if not os.path.exists(DB_PATH):
-            open(DB_PATH, 'w').close()
-
-        with get_db() as conn:
-            # Create tables if they don't exist
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS folders (
-                    id TEXT PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    user_id TEXT NOT NULL
-                )
-            ''')
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS files (
-                    id TEXT PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    folder_id TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    FOREIGN KEY (folder_id) REFERENCES folders(id)
-                )
-            ''')
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS spaces (
-                    id TEXT PRIMARY KEY,
-                    type TEXT NOT NULL,
-                    name TEXT NOT NULL,
-                    folder_id TEXT NOT NULL,
-                    notes TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (folder_id) REFERENCES folders(id)
-                )
-            ''')
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS chat_messages (
-                    id TEXT PRIMARY KEY,
-                    space_id TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (space_id) REFERENCES spaces(id)
-                )
-            ''')
-            conn.commit()
-            logging.info("Database initialized successfully")
-    except Exception as e:
-        logging.error(f"Database initialization error: {str(e)}")
-        logging.error(traceback.format_exc())
-        raise
-
-# Initialize the database
-init_db()
+        return await call_next(request)
+    finally:
+        pregenerate.active_requests -= 1
 
-app = FastAPI()
+# Abandoned requests (client gone or deadline passed) are cancelled, freeing their provider calls
+app.add_middleware(DeadlineMiddleware)
+# Stage timings for every request, slow-request log and admin-triggered profiles
+app.add_middleware(TimingMiddleware)
 
+# Outermost, so responses produced by the middleware above carry CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Profile-Id"],
     allow_credentials=True
 )
 
-def extract_text_from_pdf(file_bytes: bytes) -> str:
+async def run_ingest(file_id: str):
     try:
-        with BytesIO(file_bytes) as pdf_file:
-            reader = PdfReader(pdf_file)
-            text = []
-            for page in reader.pages:
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text.append(page_text)
-                except Exception as e:
-                    logging.error(f"Page extraction error: {str(e)}")
-                    continue
-            return " ".join(text) if text else "NO_READABLE_CONTENT"
-    except Exception as e:
-        logging.error(f"PDF processing failed: {str(e)}")
-        logging.error(traceback.format_exc())
-        return "PDF_PROCESSING_ERROR"
+        await run_extraction(ingest_file, file_id)
+    except BrokenProcessPool:
+        # The file crashes the extractor; fail it so a restart does not resume it
+        logging.error(f"Extraction crashed on file: {file_id}")
+        mark_failed(file_id, "The PDF could not be processed (the extractor crashed)")
+        spool_path(file_id).unlink(missing_ok=True)
+    invalidate("file", file_id)
+    pregenerate.schedule(file_id)
 
 @app.post("/upload/{folder_id}")
-async def upload_file(folder_id: str, file: UploadFile = File(...)):
+async def upload_file(folder_id: str, background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     try:
         logging.info(f"Received file: {file.filename} for folder: {folder_id}")
         
@@ -132,29 +132,28 @@ async def upload_file(folder_id: str, file: UploadFile = File(...)):
             if not folder:
                 raise HTTPException(404, "Folder not found")
 
-        # Read and process the file
+        # Read the file and hand it to the background extractor
         file_bytes = await file.read()
         if not file_bytes:
             raise HTTPException(400, "Empty file")
 
-        extracted_text = extract_text_from_pdf(file_bytes)
-        if extracted_text in ["NO_READABLE_CONTENT", "PDF_PROCESSING_ERROR"]:
-            raise HTTPException(400, f"Failed to extract text from PDF: {extracted_text}")
-
-        # Generate file ID and save to database
-        file_id = str(uuid.uuid4())
+        file_id = new_id()
+        spool_upload(file_id, file_bytes)
         with get_db() as conn:
             conn.execute(
-                "INSERT INTO files (id, name, folder_id, content) VALUES (?, ?, ?, ?)",
-                (file_id, file.filename, folder_id, extracted_text)
+                "INSERT INTO files (id, name, folder_id, content, status) VALUES (?, ?, ?, '', 'processing')",
+                (file_id, file.filename, folder_id)
             )
             conn.commit()
+        # Only the folder's file list and its spaces' context change
+        invalidate("resources", folder_id)
+        background_tasks.add_task(run_ingest, file_id)
 
-        logging.info(f"File uploaded successfully: {file_id}")
+        logging.info(f"File accepted for processing: {file_id}")
         return {
             "id": file_id,
             "name": file.filename,
-            "content_preview": extracted_text[:200] if len(extracted_text) > 200 else extracted_text
+            "status": "processing"
         }
     except HTTPException as he:
         logging.error(f"HTTP error during upload: {str(he)}")
@@ -164,10 +163,186 @@ async def upload_file(folder_id: str, file: UploadFile = File(...)):
         logging.error(traceback.format_exc())
         raise HTTPException(500, f"Failed to upload file: {str(e)}")
 
+@app.get("/files/{file_id}/progress")
+async def get_file_progress(file_id: str):
+    with get_db() as conn:
+        file = conn.execute(
+            "SELECT id, status, page_count, pages_done, error, duplicate_of FROM files WHERE id = ?",
+            (file_id,)
+        ).fetchone()
+
+    if not file:
+        raise HTTPException(404, "File not found")
+    return dict(file)
+
+@app.get("/files/{file_id}/duplicates")
+async def get_file_duplicates(file_id: str):
+    with get_db() as conn:
+        file = conn.execute(
+            "SELECT f.folder_id, s.signature FROM files f LEFT JOIN file_signatures s ON s.file_id = f.id WHERE f.id = ?",
+            (file_id,)
+        ).fetchone()
+        if not file:
+            raise HTTPException(404, "File not found")
+
+        duplicates = find_near_duplicates(conn, file["folder_id"], file["signature"], exclude=[file_id])
+    return {"file_id": file_id, "duplicates": duplicates}
+
+# Bulk upload limits (a ZIP can expand far beyond its upload size)
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "200"))
+BULK_MAX_TOTAL_BYTES = int(os.getenv("BULK_MAX_TOTAL_BYTES", str(500 * 1024 * 1024)))
+
+def bulk_error(name: str, error: str, status: str = "error") -> tuple:
+    # A document that is reported as-is instead of being extracted
+    return (name, None, {"name": name, "status": status, "error": error})
+
+def expand_bulk_upload(filename: str, file_bytes: bytes) -> List[tuple]:
+    """Return (name, bytes, result) triples, unpacking ZIP archives into their PDF members.
+
+    Every input gets an entry: damaged archives or members and archives
+    without PDFs become errors and other members are reported as skipped,
+    each with ``bytes`` None and its ``result`` ready for the response.
+    """
+    if not zipfile.is_zipfile(BytesIO(file_bytes)):
+        return [(filename, file_bytes, None)]
+
+    entries = []
+    documents = 0
+    total_size = 0
+    try:
+        archive = zipfile.ZipFile(BytesIO(file_bytes))
+    except Exception as e:
+        return [bulk_error(filename, f"Invalid ZIP archive: {str(e)}")]
+    with archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/"):
+                continue
+            if not name.lower().endswith(".pdf"):
+                entries.append(bulk_error(os.path.basename(name), f"Not a PDF (in {filename})", "skipped"))
+                continue
+            documents += 1
+            total_size += info.file_size
+            if documents > BULK_MAX_FILES or total_size > BULK_MAX_TOTAL_BYTES:
+                raise HTTPException(413, "ZIP archive exceeds bulk upload limits")
+            try:
+                entries.append((os.path.basename(name), archive.read(info), None))
+            except Exception as e:
+                # Corrupt, truncated or encrypted member
+                entries.append(bulk_error(os.path.basename(name), f"Failed to read from {filename}: {str(e)}"))
+    if not documents:
+        # Office documents (.docx, .pptx, ...) are ZIP files too
+        return [bulk_error(filename, "No PDF files found in the archive")]
+    return entries
+
+@app.post("/upload/{folder_id}/bulk")
+async def upload_files_bulk(folder_id: str, files: List[UploadFile] = File(...), skip_duplicates: bool = False):
+    try:
+        logging.info(f"Received bulk upload of {len(files)} file(s) for folder: {folder_id}")
+
+        with get_db() as conn:
+            folder = conn.execute(
+                "SELECT id FROM folders WHERE id = ?",
+                (folder_id,)
+            ).fetchone()
+
+            if not folder:
+                raise HTTPException(404, "Folder not found")
+
+        # Flatten uploads and ZIP archives into individual documents
+        documents = []
+        for upload in files:
+            file_bytes = await upload.read()
+            if not file_bytes:
+                documents.append(bulk_error(upload.filename, "Empty file"))
+                continue
+            documents.extend(expand_bulk_upload(upload.filename, file_bytes))
+
+        if sum(1 for _, data, _ in documents if data) > BULK_MAX_FILES:
+            raise HTTPException(413, f"Too many files (max {BULK_MAX_FILES})")
+        if sum(len(data) for _, data, _ in documents if data) > BULK_MAX_TOTAL_BYTES:
+            raise HTTPException(413, "Bulk upload exceeds size limit")
+
+        # Extract all documents (and their MinHash signatures) concurrently
+        with span("extract"):
+            extractions = await asyncio.gather(*[
+                run_extraction(extract_document, data, current_deadline())
+                for _, data, _ in documents if data
+            ], return_exceptions=True)
+
+        results = []
+        rows = []
+        accepted = []
+        extracted = iter(extractions)
+        with get_db() as conn:
+            for name, data, result in documents:
+                if not data:
+                    results.append(result)
+                    continue
+
+                extraction = next(extracted)
+                if isinstance(extraction, Exception):
+                    results.append({"name": name, "status": "error", "error": str(extraction)})
+                    continue
+                text, signature = extraction
+                if text in [NO_READABLE_CONTENT, PDF_PROCESSING_ERROR]:
+                    results.append({"name": name, "status": "error", "error": f"Failed to extract text from PDF: {text}"})
+                    continue
+
+                # Near-duplicates of stored files or of earlier files in this batch
+                duplicates = find_near_duplicates(conn, folder_id, signature)
+                duplicate_of = duplicates[0]["file_id"] if duplicates else next((
+                    other_id for other_id, other in accepted
+                    if signature and other and similarity(signature, other) >= SIMILARITY_THRESHOLD
+                ), None)
+                if duplicate_of and skip_duplicates:
+                    results.append({"name": name, "status": "duplicate", "duplicate_of": duplicate_of})
+                    continue
+
+                file_id = new_id()
+                rows.append((file_id, name, folder_id, text, duplicate_of))
+                accepted.append((file_id, signature))
+                results.append({
+                    "id": file_id,
+                    "name": name,
+                    "status": "ok",
+                    "duplicate_of": duplicate_of,
+                    "content_preview": text[:200]
+                })
+
+            # Insert every successfully extracted document in a single transaction
+            if rows:
+                conn.executemany(
+                    "INSERT INTO files (id, name, folder_id, content, duplicate_of) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                for file_id, signature in accepted:
+                    store_signature(conn, file_id, folder_id, signature)
+                conn.commit()
+                invalidate("resources", folder_id)
+                for row in rows:
+                    pregenerate.schedule(row[0])
+
+        logging.info(f"Bulk upload stored {len(rows)}/{len(results)} file(s) in folder: {folder_id}")
+        return {
+            "uploaded": len(rows),
+            "duplicates": sum(1 for result in results if result["status"] == "duplicate"),
+            "failed": sum(1 for result in results if result["status"] == "error"),
+            "skipped": sum(1 for result in results if result["status"] == "skipped"),
+            "files": results
+        }
+    except HTTPException as he:
+        logging.error(f"HTTP error during bulk upload: {str(he)}")
+        raise
+    except Exception as e:
+        logging.error(f"Bulk upload failed: {str(e)}")
+        logging.error(traceback.format_exc())
+        raise HTTPException(500, f"Failed to upload files: {str(e)}")
+
 # Endpoints
 @app.post("/folders")
 async def create_folder(folder: Folder):
-    folder_id = str(uuid.uuid4())
+    folder_id = new_id()
     try:
         with get_db() as conn:
             conn.execute(
@@ -175,6 +350,8 @@ async def create_folder(folder: Folder):
                 (folder_id, folder.name, folder.user_id)
             )
             conn.commit()
+        tree_cache.add_folder(folder.user_id, {"id": folder_id, "name": folder.name})
+        invalidate("user", folder.user_id, local=False)
         return {"id": folder_id}
     except Exception as e:
         raise HTTPException(500, f"Failed to create folder: {str(e)}")
@@ -184,7 +361,7 @@ async def validate_file(file_id: str):
     try:
         with get_db() as conn:
             file = conn.execute(
-                "SELECT id, name FROM files WHERE id = ?", 
+                "SELECT id, name, status FROM files WHERE id = ?", 
                 (file_id,)
             ).fetchone()
         
@@ -197,7 +374,8 @@ async def validate_file(file_id: str):
         return {
             "valid": True,
             "fileId": file["id"],
-            "name": file["name"]
+            "name": file["name"],
+            "status": file["status"]
         }
     except Exception as e:
         raise HTTPException(500, f"Validation failed: {str(e)}")
@@ -211,16 +389,15 @@ async def debug_files():
 async def get_file_content(file_id: str):
     try:
         with get_db() as conn:
-            file = conn.execute(
-                "SELECT content FROM files WHERE id = ?", 
-                (file_id,)
-            ).fetchone()
+            file = get_file_text(conn, file_id)
             
             if not file:
                 raise HTTPException(404, detail="File not found")
                 
-            return {"content": file["content"]}
+            return {"content": file["content"], "status": file["status"]}
             
+    except HTTPException:
+        raise
     except sqlite3.Error as e:
         raise HTTPException(500, detail=f"Database error: {str(e)}")
     except Exception as e:
@@ -229,22 +406,11 @@ async def get_file_content(file_id: str):
 @app.get("/folders/{folder_id}/resources")
 async def get_resources(folder_id: str):
     try:
-        with get_db() as conn:
-            # Verify folder exists
-            folder = conn.execute(
-                "SELECT id FROM folders WHERE id = ?",
-                (folder_id,)
-            ).fetchone()
-            if not folder:
-                raise HTTPException(404, "Folder not found")
-            
-            # Get resources
-            resources = conn.execute(
-                "SELECT id, name FROM files WHERE folder_id = ?",
-                (folder_id,)
-            ).fetchall()
-            
-        return [dict(resource) for resource in resources]
+        # Served from memory until a write to the folder's files invalidates it
+        resources = cached_resources(folder_id)
+        if resources is None:
+            raise HTTPException(404, "Folder not found")
+        return resources
     except Exception as e:
         raise HTTPException(500, f"Failed to get resources: {str(e)}")
 
@@ -270,7 +436,10 @@ async def generate_notes_endpoint(request: NotesRequest):
         raise HTTPException(400, "No content provided for generating notes")
     
     try:
-        notes = await generate_notes(request.context)
+        with get_db() as conn:
+            notes = pregenerate.take_artifact(conn, request.context, "notes")
+        if notes is None:
+            notes = await generate_notes(request.context)
         return {"notes": notes}
     except Exception as e:
         logging.error(f"Notes generation failed: {str(e)}")
@@ -282,13 +451,24 @@ async def health_check():
 
 class ChatRequest(BaseModel):
     message: str
-    context: str
+    context: Optional[str] = None
+    space_id: Optional[str] = None
 
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks):
     try:
         logging.info(f"Received chat request: {request.message[:100]}...")
-        response = await ask_ai(request.message, request.context)
+        context, summary, history = request.context, None, None
+        if request.space_id:
+            # Rolling summary plus the recent turns keeps the prompt size bounded
+            with span("prompt-build"), get_db() as conn:
+                if context is None:
+                    context = get_space_context(conn, request.space_id)
+                summary, history, needs_fold = load_memory(conn, request.space_id, request.message)
+            if needs_fold:
+                background_tasks.add_task(fold_conversation, request.space_id)
+
+        response = await ask_ai(request.message, context, history=history, summary=summary)
         logging.info("Successfully generated chat response")
         return {"response": response}
     except Exception as e:
@@ -302,34 +482,13 @@ async def chat_endpoint(request: ChatRequest):
 @app.get("/folders")
 async def get_folders(user_id: str = "default"):
     try:
-        with get_db() as conn:
-            # Get folders
-            folders = conn.execute(
-                "SELECT id, name FROM folders WHERE user_id = ?",
-                (user_id,)
-            ).fetchall()
-            
-            # Get spaces for each folder
-            result = []
-            for folder in folders:
-                spaces = conn.execute(
-                    "SELECT id, type, name, notes FROM spaces WHERE folder_id = ?",
-                    (folder["id"],)
-                ).fetchall()
-                
-                result.append({
-                    "id": folder["id"],
-                    "name": folder["name"],
-                    "spaces": [dict(space) for space in spaces]
-                })
-            
-            return result
+        return cached_folders(user_id)
     except Exception as e:
         raise HTTPException(500, f"Failed to get folders: {str(e)}")
 
 @app.post("/spaces")
 async def create_space(space: Space):
-    space_id = str(uuid.uuid4())
+    space_id = new_id()
     try:
         logging.info(f"Creating space: {space.dict()}")
         with get_db() as conn:
@@ -355,13 +514,17 @@ async def create_space(space: Space):
                 raise HTTPException(500, f"Database error: {str(e)}")
             
             logging.info(f"Space created successfully: {space_id}")
-            return {
+            created = {
                 "id": space_id,
                 "type": space.type,
                 "name": space.name,
                 "folder_id": space.folder_id,
                 "notes": space.notes
             }
+        tree_cache.put_space(created)
+        # Other workers do not know the new space yet, only the folder it joins
+        invalidate("folder", space.folder_id, local=False)
+        return created
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -372,16 +535,10 @@ async def create_space(space: Space):
 @app.get("/spaces/{space_id}")
 async def get_space(space_id: str):
     try:
-        with get_db() as conn:
-            space = conn.execute(
-                "SELECT id, type, name, folder_id, notes FROM spaces WHERE id = ?",
-                (space_id,)
-            ).fetchone()
-            
-            if not space:
-                raise HTTPException(404, "Space not found")
-                
-            return dict(space)
+        space = cached_space(space_id)
+        if space is None:
+            raise HTTPException(404, "Space not found")
+        return space
     except Exception as e:
         raise HTTPException(500, f"Failed to get space: {str(e)}")
 
@@ -411,8 +568,8 @@ async def update_space(space_id: str, space_update: dict):
                 if update_fields:
                     query = f"UPDATE spaces SET {', '.join(update_fields)} WHERE id = ?"
                     params.append(space_id)
-                    conn.execute(query, params)
-                    conn.commit()
+                    # Note edits arrive often while typing; batch them with other small writes
+                    await write_queue.write(query, params)
             except sqlite3.Error as e:
                 logging.error(f"Database error while updating space: {str(e)}")
                 logging.error(traceback.format_exc())
@@ -427,13 +584,17 @@ async def update_space(space_id: str, space_update: dict):
             if not updated_space:
                 raise HTTPException(404, "Space not found after update")
             
-            return {
+            updated = {
                 "id": updated_space[0],
                 "type": updated_space[1],
                 "name": updated_space[2],
                 "folder_id": updated_space[3],
                 "notes": updated_space[4]
             }
+        if update_fields:
+            tree_cache.put_space(updated)
+            invalidate("space", space_id, local=False)
+        return updated
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -441,17 +602,99 @@ async def update_space(space_id: str, space_update: dict):
         logging.error(traceback.format_exc())
         raise HTTPException(500, f"Failed to update space: {str(e)}")
 
+class SpaceFilesRequest(BaseModel):
+    file_ids: List[str]
+
+@app.get("/spaces/{space_id}/files")
+async def get_space_files(space_id: str):
+    with get_db() as conn:
+        resolved = space_file_ids(conn, space_id)
+    if resolved is None:
+        raise HTTPException(404, "Space not found")
+    return {"space_id": space_id, "file_ids": resolved[1]}
+
+@app.put("/spaces/{space_id}/files")
+async def set_space_files(space_id: str, request: SpaceFilesRequest):
+    try:
+        with get_db() as conn:
+            space = conn.execute(
+                "SELECT id FROM spaces WHERE id = ?",
+                (space_id,)
+            ).fetchone()
+            if not space:
+                raise HTTPException(404, "Space not found")
+
+            # An empty selection falls back to every file in the space's folder
+            conn.execute("DELETE FROM space_files WHERE space_id = ?", (space_id,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO space_files (space_id, file_id, position) VALUES (?, ?, ?)",
+                [(space_id, file_id, position) for position, file_id in enumerate(request.file_ids)]
+            )
+            conn.commit()
+        invalidate("space", space_id)
+        return {"space_id": space_id, "file_ids": request.file_ids}
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logging.error(f"Failed to set space files: {str(e)}")
+        logging.error(traceback.format_exc())
+        raise HTTPException(500, f"Failed to set space files: {str(e)}")
+
+@app.get("/debug/write-queue")
+async def debug_write_queue():
+    return write_queue.stats()
+
+@app.get("/debug/context-cache")
+async def debug_context_cache():
+    return context_cache.stats()
+
+@app.get("/debug/tree-cache")
+async def debug_tree_cache():
+    return tree_cache.stats()
+
+# Admin-only diagnostics (ADMIN_UIDS); profiles are saved as collapsed stacks for
+# flamegraph.pl or speedscope. Send "X-Profile: 1" to profile a single request.
+@app.get("/admin/slow-requests")
+async def admin_slow_requests(admin: dict = Depends(require_admin)):
+    return list(recent_slow_requests)
+
+@app.post("/admin/profiles")
+async def admin_profile_window(seconds: float = 10, admin: dict = Depends(require_admin)):
+    return await profile_window(seconds)
+
+@app.get("/admin/profiles")
+async def admin_list_profiles(admin: dict = Depends(require_admin)):
+    return list_profiles()
+
+@app.get("/admin/profiles/{profile_id}")
+async def admin_download_profile(profile_id: str, admin: dict = Depends(require_admin)):
+    return FileResponse(profile_path(profile_id), media_type="text/plain", filename=f"{profile_id}.folded")
+
 @app.delete("/folders/{folder_id}")
 async def delete_folder(folder_id: str):
     try:
         with get_db() as conn:
             # Delete all files in the folder
+            delete_signatures(conn, folder_id=folder_id)
+            conn.execute(
+                "DELETE FROM generated_artifacts WHERE file_id IN (SELECT id FROM files WHERE folder_id = ?)",
+                (folder_id,)
+            )
+            conn.execute(
+                "DELETE FROM file_pages WHERE file_id IN (SELECT id FROM files WHERE folder_id = ?)",
+                (folder_id,)
+            )
             conn.execute("DELETE FROM files WHERE folder_id = ?", (folder_id,))
             # Delete all spaces in the folder
+            conn.execute(
+                "DELETE FROM space_files WHERE space_id IN (SELECT id FROM spaces WHERE folder_id = ?)",
+                (folder_id,)
+            )
             conn.execute("DELETE FROM spaces WHERE folder_id = ?", (folder_id,))
             # Delete the folder
             conn.execute("DELETE FROM folders WHERE id = ?", (folder_id,))
             conn.commit()
+        invalidate("folder", folder_id)
         return {"message": "Folder and all its contents deleted successfully"}
     except Exception as e:
         raise HTTPException(500, f"Failed to delete folder: {str(e)}")
@@ -460,8 +703,13 @@ async def delete_folder(folder_id: str):
 async def delete_file(file_id: str):
     try:
         with get_db() as conn:
+            conn.execute("DELETE FROM file_pages WHERE file_id = ?", (file_id,))
+            delete_signatures(conn, file_id=file_id)
+            conn.execute("DELETE FROM generated_artifacts WHERE file_id = ?", (file_id,))
+            conn.execute("DELETE FROM space_files WHERE file_id = ?", (file_id,))
             conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
             conn.commit()
+        invalidate("file", file_id)
         return {"message": "File deleted successfully"}
     except Exception as e:
         raise HTTPException(500, f"Failed to delete file: {str(e)}")
@@ -470,12 +718,64 @@ async def delete_file(file_id: str):
 async def delete_space(space_id: str):
     try:
         with get_db() as conn:
+            conn.execute("DELETE FROM space_files WHERE space_id = ?", (space_id,))
             conn.execute("DELETE FROM spaces WHERE id = ?", (space_id,))
             conn.commit()
+        invalidate("space", space_id)
         return {"message": "Space deleted successfully"}
     except Exception as e:
         raise HTTPException(500, f"Failed to delete space: {str(e)}")
 
+def export_response(records, format: str, name: str) -> StreamingResponse:
+    if format == "zip":
+        return StreamingResponse(
+            iter_zip(records),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{name}.zip"'}
+        )
+    if format == "ndjson":
+        return StreamingResponse(
+            iter_ndjson(records),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="{name}.ndjson"'}
+        )
+    raise HTTPException(400, "Format must be 'ndjson' or 'zip'")
+
+@app.get("/export")
+async def export_user(user_id: str = "default", format: str = "ndjson"):
+    # Streamed straight from the database, so memory stays flat however much the user has
+    return export_response(iter_records(user_id=user_id), format, f"studybuddy-{user_id}")
+
+@app.get("/folders/{folder_id}/export")
+async def export_folder(folder_id: str, format: str = "ndjson"):
+    with get_db() as conn:
+        if not conn.execute("SELECT id FROM folders WHERE id = ?", (folder_id,)).fetchone():
+            raise HTTPException(404, "Folder not found")
+    return export_response(iter_records(folder_id=folder_id), format, f"studybuddy-folder-{folder_id}")
+
+@app.post("/import")
+async def import_data(file: UploadFile = File(...), user_id: Optional[str] = None):
+    try:
+        # Pass user_id to import into a different user; folders another user already has are copied with new IDs
+        result = await asyncio.to_thread(lambda: import_records(open_import(file.file), user_id))
+        for folder_id in result["folders"]:
+            invalidate("folder", folder_id)
+        # New folders are not in any cached folder list yet, so drop their owners' lists
+        with get_db() as conn:
+            owners = conn.execute(
+                f"SELECT DISTINCT user_id FROM folders WHERE id IN ({', '.join('?' * len(result['folders']))})",
+                result["folders"]
+            ).fetchall()
+        for owner in owners:
+            invalidate("user", owner["user_id"])
+        return result
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid export: {str(e)}")
+    except Exception as e:
+        logging.error(f"Import failed: {str(e)}")
+        logging.error(traceback.format_exc())
+        raise HTTPException(500, f"Failed to import data: {str(e)}")
+
 @app.delete("/clear-all")
 async def clear_all_data(user_id: str = "default"):
     try:
@@ -488,16 +788,59 @@ async def clear_all_data(user_id: str = "default"):
             
             # Delete all files and spaces for each folder
             for folder in folders:
+                delete_signatures(conn, folder_id=folder["id"])
+                conn.execute(
+                    "DELETE FROM generated_artifacts WHERE file_id IN (SELECT id FROM files WHERE folder_id = ?)",
+                    (folder["id"],)
+                )
+                conn.execute(
+                    "DELETE FROM file_pages WHERE file_id IN (SELECT id FROM files WHERE folder_id = ?)",
+                    (folder["id"],)
+                )
                 conn.execute("DELETE FROM files WHERE folder_id = ?", (folder["id"],))
+                conn.execute(
+                    "DELETE FROM space_files WHERE space_id IN (SELECT id FROM spaces WHERE folder_id = ?)",
+                    (folder["id"],)
+                )
                 conn.execute("DELETE FROM spaces WHERE folder_id = ?", (folder["id"],))
             
             # Delete all folders for the user
             conn.execute("DELETE FROM folders WHERE user_id = ?", (user_id,))
             conn.commit()
+        for folder in folders:
+            invalidate("folder", folder["id"])
         return {"message": "All data cleared successfully"}
     except Exception as e:
         raise HTTPException(500, f"Failed to clear data: {str(e)}")
 
+def selected_content(file_ids: list) -> str:
+    """Combined text of the selected files, for quiz and flashcard prompts."""
+    content = []
+    with span("prompt-build"), get_db() as conn:
+        # Near-duplicate files would only repeat the same text to the model
+        for file_id in unique_file_ids(conn, file_ids):
+            file = get_file_text(conn, file_id)
+
+            if not file:
+                raise HTTPException(status_code=404, detail=f"File {file_id} not found")
+
+            content.append(file["content"])
+    return "\n\n".join(content)
+
+async def ndjson_items(items):
+    # One parsed item per line, sent as soon as the model has finished it
+    try:
+        async for item in items:
+            yield json.dumps(parse_item(item)) + "\n"
+    except Exception as e:
+        logging.error(f"Streamed generation failed: {str(e)}")
+        logging.error(traceback.format_exc())
+        yield json.dumps({"error": str(e)}) + "\n"
+
+async def replay_items(items: List[str]):
+    for item in items:
+        yield item
+
 @app.post("/generate-quiz")
 async def generate_quiz_endpoint(request: Request):
     try:
@@ -514,22 +857,7 @@ async def generate_quiz_endpoint(request: Request):
         if not any(question_types.values()):
             raise HTTPException(status_code=400, detail="At least one question type must be selected")
 
-        # Get content from all selected files from the database
-        content = []
-        with get_db() as conn:
-            for file_id in file_ids:
-                file = conn.execute(
-                    "SELECT content FROM files WHERE id = ?",
-                    (file_id,)
-                ).fetchone()
-                
-                if not file:
-                    raise HTTPException(status_code=404, detail=f"File {file_id} not found")
-                
-                content.append(file["content"])
-
-        # Combine all content
-        combined_content = "\n\n".join(content)
+        combined_content = selected_content(file_ids)
 
         # Generate quiz
         quiz = await generate_quiz(combined_content, options)
@@ -542,6 +870,20 @@ async def generate_quiz_endpoint(request: Request):
         logging.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate-quiz/stream")
+async def stream_quiz_endpoint(request: Request):
+    body = await request.json()
+    file_ids = body.get("file_ids", [])
+    options = body.get("options", {})
+
+    if not file_ids:
+        raise HTTPException(status_code=400, detail="No file IDs provided")
+    if not any(options.get("question_types", {}).values()):
+        raise HTTPException(status_code=400, detail="At least one question type must be selected")
+
+    combined_content = selected_content(file_ids)
+    return StreamingResponse(ndjson_items(stream_quiz(combined_content, options)), media_type="application/x-ndjson")
+
 @app.post("/generate-flashcards")
 async def generate_flashcards_endpoint(request: Request):
     try:
@@ -554,25 +896,15 @@ async def generate_flashcards_endpoint(request: Request):
         if not file_ids:
             raise HTTPException(status_code=400, detail="No file IDs provided")
 
-        # Get content from all selected files from the database
-        content = []
-        with get_db() as conn:
-            for file_id in file_ids:
-                file = conn.execute(
-                    "SELECT content FROM files WHERE id = ?",
-                    (file_id,)
-                ).fetchone()
-                
-                if not file:
-                    raise HTTPException(status_code=404, detail=f"File {file_id} not found")
-                
-                content.append(file["content"])
-
-        # Combine all content
-        combined_content = "\n\n".join(content)
+        combined_content = selected_content(file_ids)
 
-        # Generate flashcards
-        flashcards = await generate_flashcards(combined_content, num_flashcards)
+        # Generate flashcards, unless they were prepared in the background after upload
+        with get_db() as conn:
+            flashcards = pregenerate.take_artifact(
+                conn, combined_content, "flashcards", pregenerate.options_key("flashcards", num_flashcards)
+            )
+        if flashcards is None:
+            flashcards = await generate_flashcards(combined_content, num_flashcards)
         return {"flashcards": flashcards}
 
     except HTTPException as he:
@@ -582,9 +914,29 @@ async def generate_flashcards_endpoint(request: Request):
         logging.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate-flashcards/stream")
+async def stream_flashcards_endpoint(request: Request):
+    body = await request.json()
+    file_ids = body.get("file_ids", [])
+    num_flashcards = body.get("options", {}).get("num_flashcards", 5)
+
+    if not file_ids:
+        raise HTTPException(status_code=400, detail="No file IDs provided")
+
+    combined_content = selected_content(file_ids)
+    with get_db() as conn:
+        stored = pregenerate.take_artifact(
+            conn, combined_content, "flashcards", pregenerate.options_key("flashcards", num_flashcards)
+        )
+    if stored is not None:
+        items = replay_items(split_items(stored, FLASHCARD_FIELDS)[:num_flashcards])
+    else:
+        items = stream_flashcards(combined_content, num_flashcards)
+    return StreamingResponse(ndjson_items(items), media_type="application/x-ndjson")
+
 @app.post("/spaces/{space_id}/messages")
 async def add_message(space_id: str, message: ChatMessage):
-    message_id = str(uuid.uuid4())
+    message_id = new_id()
     try:
         with get_db() as conn:
             # Verify space exists
@@ -595,23 +947,22 @@ async def add_message(space_id: str, message: ChatMessage):
             if not space:
                 raise HTTPException(404, "Space not found")
             
-            # Add message
-            conn.execute(
-                """
-                INSERT INTO chat_messages (id, space_id, role, content, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                (message_id, space_id, message.role, message.content, datetime.now())
-            )
-            conn.commit()
-            
-            return {
-                "id": message_id,
-                "space_id": space_id,
-                "role": message.role,
-                "content": message.content,
-                "timestamp": datetime.now()
-            }
+        # Add message through the group-commit queue; returns once it is durable
+        await write_queue.write(
+            """
+            INSERT INTO chat_messages (id, space_id, role, content, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (message_id, space_id, message.role, message.content, datetime.now())
+        )
+
+        return {
+            "id": message_id,
+            "space_id": space_id,
+            "role": message.role,
+            "content": message.content,
+            "timestamp": datetime.now()
+        }
     except Exception as e:
         logging.error(f"Failed to add message: {str(e)}")
         logging.error(traceback.format_exc())
@@ -626,7 +977,7 @@ async def get_messages(space_id: str):
                 SELECT id, space_id, role, content, timestamp
                 FROM chat_messages
                 WHERE space_id = ?
-                ORDER BY timestamp ASC
+                ORDER BY id ASC
                 """,
                 (space_id,)
             ).fetchall()
@@ -646,6 +997,7 @@ async def delete_messages(space_id: str):
                 "DELETE FROM chat_messages WHERE space_id = ?",
                 (space_id,)
             )
+            reset_memory(conn, space_id)
             conn.commit()
         return {"message": "Messages deleted successfully"}
     except Exception as e:
@@ -655,4 +1007,9 @@ async def delete_messages(space_id: str):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Multi-worker mode: WEB_CONCURRENCY=8 python main.py (or uvicorn main:app --workers 8)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,7 +1,186 @@
-from PyPDF2 import PdfReader
 import os
+import time
+import logging
+import traceback
+from io import BytesIO
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-def extract_text_from_pdf(file_path: str) -> str:
-    with open(file_path, "rb") as f:
-        reader = PdfReader(f)
-        return " ".join([page.extract_text() for page in reader.pages])
\ No newline at end of file
+# Sentinels returned instead of text when nothing usable could be extracted
+NO_READABLE_CONTENT = "NO_READABLE_CONTENT"
+PDF_PROCESSING_ERROR = "PDF_PROCESSING_ERROR"
+
+# Backends are tried in this order; unavailable or failing ones fall through to the next
+DEFAULT_BACKENDS = "pypdfium2,pypdf,pdfminer,pypdf2"
+
+
+def _pypdfium2_pages(file_bytes: bytes) -> Iterator[Tuple[Optional[int], str]]:
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(file_bytes)
+    try:
+        page_count = len(pdf)
+        for index in range(page_count):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            try:
+                yield page_count, textpage.get_text_bounded()
+            finally:
+                textpage.close()
+                page.close()
+    finally:
+        pdf.close()
+
+
+def _pypdf_pages(file_bytes: bytes) -> Iterator[Tuple[Optional[int], str]]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(BytesIO(file_bytes))
+    page_count = len(reader.pages)
+    for page in reader.pages:
+        yield page_count, page.extract_text() or ""
+
+
+def _pdfminer_pages(file_bytes: bytes) -> Iterator[Tuple[Optional[int], str]]:
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+
+    # pdfminer parses lazily and cannot report the page count up front
+    for layout in extract_pages(BytesIO(file_bytes)):
+        yield None, "".join(
+            element.get_text() for element in layout if isinstance(element, LTTextContainer)
+        )
+
+
+def _pypdf2_pages(file_bytes: bytes) -> Iterator[Tuple[Optional[int], str]]:
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(BytesIO(file_bytes))
+    page_count = len(reader.pages)
+    for page in reader.pages:
+        try:
+            yield page_count, page.extract_text() or ""
+        except Exception as e:
+            logging.error(f"Page extraction error: {str(e)}")
+            yield page_count, ""
+
+
+# Each backend yields (page_count, page_text) for every page in order
+BACKENDS: Dict[str, Callable[[bytes], Iterator[Tuple[Optional[int], str]]]] = {
+    "pypdfium2": _pypdfium2_pages,
+    "pypdf": _pypdf_pages,
+    "pdfminer": _pdfminer_pages,
+    "pypdf2": _pypdf2_pages,
+}
+
+_BACKEND_MODULES = {
+    "pypdfium2": "pypdfium2",
+    "pypdf": "pypdf",
+    "pdfminer": "pdfminer.high_level",
+    "pypdf2": "PyPDF2",
+}
+
+
+def available_backends() -> List[str]:
+    """Names of the backends whose library is installed."""
+    import importlib.util
+
+    available = []
+    for name, module in _BACKEND_MODULES.items():
+        try:
+            if importlib.util.find_spec(module) is not None:
+                available.append(name)
+        except ModuleNotFoundError:
+            continue
+    return available
+
+
+def configured_backends() -> List[str]:
+    """Backend order from PDF_EXTRACTOR (comma separated), restricted to known names."""
+    names = [name.strip().lower() for name in os.getenv("PDF_EXTRACTOR", DEFAULT_BACKENDS).split(",")]
+    unknown = [name for name in names if name and name not in BACKENDS]
+    if unknown:
+        logging.warning(f"Ignoring unknown PDF extractor backend(s): {', '.join(unknown)}")
+    return [name for name in names if name in BACKENDS]
+
+
+def extract_pages(file_bytes: bytes, backend: str, deadline: Optional[float] = None) -> List[str]:
+    """Extract the text of every page with a single backend, raising on failure.
+
+    Raises TimeoutError once ``deadline`` (a ``time.time()`` timestamp) has passed.
+    """
+    pages = []
+    for _, text in BACKENDS[backend](file_bytes):
+        if deadline is not None and time.time() >= deadline:
+            raise TimeoutError("Extraction deadline exceeded")
+        pages.append(text)
+    return pages
+
+
+def iter_pages(file_bytes: bytes, start: int = 0, backends: Optional[List[str]] = None) -> Iterator[Tuple[int, Optional[int], str]]:
+    """Yield (page_index, page_count, text) page by page from ``start`` onwards.
+
+    If a backend fails part-way through, the next one resumes after the last
+    page that was yielded. If a backend finishes without any non-blank text,
+    the next one yields the same pages again, as extract_text_from_pdf falls
+    back. Raises ValueError when no backend could be used.
+    """
+    backends = backends or configured_backends()
+    next_page = start
+    last_error = None
+    completed = False
+    for backend in backends:
+        first_page = next_page
+        found_text = False
+        try:
+            for index, (page_count, text) in enumerate(BACKENDS[backend](file_bytes)):
+                if index < next_page:
+                    continue
+                yield index, page_count, text
+                next_page = index + 1
+                found_text = found_text or bool(text and text.strip())
+        except ImportError:
+            continue
+        except Exception as e:
+            logging.error(f"PDF processing failed with {backend} at page {next_page}: {str(e)}")
+            last_error = e
+            continue
+        if found_text:
+            return
+        completed = True
+        logging.info(f"No readable content from {backend}, trying next backend")
+        next_page = first_page
+    if not completed:
+        raise ValueError(f"{PDF_PROCESSING_ERROR}: {last_error or 'no extractor backend installed'}")
+
+
+def extract_text_from_pdf(file_bytes: bytes, backends: Optional[List[str]] = None,
+                          deadline: Optional[float] = None) -> str:
+    """Extract the document text, falling back through the configured backends.
+
+    Returns NO_READABLE_CONTENT or PDF_PROCESSING_ERROR when no backend yields text.
+    """
+    backends = backends or configured_backends()
+    attempted = False
+    failed = False
+    for backend in backends:
+        try:
+            pages = extract_pages(file_bytes, backend, deadline)
+        except ImportError:
+            continue
+        except TimeoutError:
+            raise
+        except Exception as e:
+            logging.error(f"PDF processing failed with {backend}: {str(e)}")
+            logging.debug(traceback.format_exc())
+            attempted = failed = True
+            continue
+
+        attempted = True
+        text = [page for page in pages if page and page.strip()]
+        if text:
+            return " ".join(text)
+        logging.info(f"No readable content from {backend}, trying next backend")
+
+    if not attempted:
+        logging.error(f"No PDF extractor backend installed (tried: {', '.join(backends)})")
+    return PDF_PROCESSING_ERROR if failed or not attempted else NO_READABLE_CONTENT
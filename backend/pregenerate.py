@@ -0,0 +1,142 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+
+from database import get_db
+from ai_service import generate_notes, generate_flashcards
+
+# Pre-generation is opt-in: it spends provider tokens on output nobody may open
+ENABLED = os.getenv("PREGENERATE", "").lower() in ("1", "true", "yes")
+# Estimated provider tokens pre-generation may spend per rolling hour
+TOKEN_BUDGET_PER_HOUR = int(os.getenv("PREGENERATE_TOKEN_BUDGET_PER_HOUR", "200000"))
+# Only start a job while at most this many interactive AI requests are in flight
+MAX_ACTIVE_REQUESTS = int(os.getenv("PREGENERATE_MAX_ACTIVE_REQUESTS", "0"))
+DEFAULT_NUM_FLASHCARDS = 5
+# Output tokens requested by generate_notes and generate_flashcards
+_OUTPUT_TOKENS = {"notes": 4000, "flashcards": 2000}
+IDLE_POLL_SECONDS = 1.0
+
+# Interactive AI requests currently being served, maintained by the app's middleware
+active_requests = 0
+
+_queue: Optional[asyncio.Queue] = None
+_worker: Optional[asyncio.Task] = None
+_spent = []  # (timestamp, estimated_tokens) within the last hour
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def options_key(kind: str, num_flashcards: int = DEFAULT_NUM_FLASHCARDS) -> str:
+    return f"num_flashcards={num_flashcards}" if kind == "flashcards" else ""
+
+
+def take_artifact(conn, content: str, kind: str, key: str = "") -> Optional[str]:
+    """Return and remove a pre-generated artifact for exactly this content, if any.
+
+    Artifacts are served once, so asking again produces a fresh generation.
+    """
+    digest = content_hash(content)
+    row = conn.execute(
+        "SELECT content FROM generated_artifacts WHERE content_hash = ? AND kind = ? AND options_key = ?",
+        (digest, kind, key)
+    ).fetchone()
+    if not row:
+        return None
+    conn.execute(
+        "DELETE FROM generated_artifacts WHERE content_hash = ? AND kind = ? AND options_key = ?",
+        (digest, kind, key)
+    )
+    conn.commit()
+    return row["content"]
+
+
+def _estimate_tokens(content: str, kind: str) -> int:
+    # Roughly four characters per token for English prompts
+    return len(content) // 4 + _OUTPUT_TOKENS[kind]
+
+
+def _reserve_budget(tokens: int) -> bool:
+    now = time.time()
+    _spent[:] = [(at, spent) for at, spent in _spent if now - at < 3600]
+    if sum(spent for _, spent in _spent) + tokens > TOKEN_BUDGET_PER_HOUR:
+        return False
+    _spent.append((now, tokens))
+    return True
+
+
+async def _pregenerate_file(file_id: str):
+    with get_db() as conn:
+        file = conn.execute(
+            "SELECT content, status, duplicate_of FROM files WHERE id = ?",
+            (file_id,)
+        ).fetchone()
+    if not file or file["status"] != "ready" or not file["content"]:
+        return
+    if file["duplicate_of"]:
+        logging.info(f"Skipping pre-generation for near-duplicate file {file_id}")
+        return
+
+    content = file["content"]
+    for kind in ("notes", "flashcards"):
+        while active_requests > MAX_ACTIVE_REQUESTS:
+            await asyncio.sleep(IDLE_POLL_SECONDS)
+
+        if not _reserve_budget(_estimate_tokens(content, kind)):
+            logging.info(f"Pre-generation budget exhausted; skipping {kind} for file {file_id}")
+            return
+
+        if kind == "notes":
+            result = await generate_notes(content)
+        else:
+            result = await generate_flashcards(content, DEFAULT_NUM_FLASHCARDS)
+
+        with get_db() as conn:
+            # The file may have been deleted while generating; nothing would clean the row up
+            cursor = conn.execute(
+                """
+                INSERT OR REPLACE INTO generated_artifacts (content_hash, kind, options_key, file_id, content)
+                SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM files WHERE id = ?)
+                """,
+                (content_hash(content), kind, options_key(kind), file_id, result, file_id)
+            )
+            conn.commit()
+        if not cursor.rowcount:
+            logging.info(f"File {file_id} was deleted while pre-generating; dropped its {kind}")
+            return
+        logging.info(f"Pre-generated {kind} for file {file_id}")
+
+
+async def _work():
+    while True:
+        file_id = await _queue.get()
+        try:
+            await _pregenerate_file(file_id)
+        except Exception as e:
+            logging.error(f"Pre-generation failed for file {file_id}: {str(e)}")
+        finally:
+            _queue.task_done()
+
+
+def schedule(file_id: str):
+    """Queue a freshly ingested file for background notes and flashcards."""
+    global _queue, _worker
+    if not ENABLED:
+        return
+    if _queue is None:
+        _queue = asyncio.Queue()
+    if _worker is None or _worker.done():
+        # A single worker keeps pre-generation to one provider call at a time
+        _worker = asyncio.create_task(_work())
+    _queue.put_nowait(file_id)
+
+
+def stop():
+    global _queue, _worker
+    if _worker is not None:
+        _worker.cancel()
+    _queue = _worker = None
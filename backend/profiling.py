@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from firebase_auth import get_current_user, is_admin
+from timings import Timings, request_timings, span
+
+# Requests slower than this are written to the slow log with their stage breakdown
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+# Interval between stack samples while a profile is being captured
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_MS", "5")) / 1000
+# Window captures must finish well inside the request deadline
+MAX_PROFILE_SECONDS = 30
+KEEP_PROFILES = 20
+RECENT_SLOW_REQUESTS = 100
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return super().render(content)
+
+
+# Slow log: one JSON object per line, appended by every worker
+
+_slow_logger = None
+recent_slow_requests: deque = deque(maxlen=RECENT_SLOW_REQUESTS)
+
+
+def _data_dir() -> Path:
+    from database import DATA_DIR
+    return DATA_DIR
+
+
+def slow_log():
+    global _slow_logger
+    if _slow_logger is None:
+        path = Path(os.getenv("SLOW_LOG_PATH", _data_dir() / "slow_requests.log"))
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _slow_logger = logging.getLogger("studybuddy.slow_requests")
+        _slow_logger.addHandler(handler)
+        _slow_logger.setLevel(logging.INFO)
+        _slow_logger.propagate = False
+    return _slow_logger
+
+
+def record_request(method: str, path: str, status: Optional[int], total: float, totals: Dict[str, float]):
+    total_ms = total * 1000
+    if total_ms < SLOW_REQUEST_MS:
+        return
+    stages = {stage: round(seconds * 1000, 1) for stage, seconds in totals.items()}
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "method": method,
+        "path": path,
+        "status": status,
+        "total_ms": round(total_ms, 1),
+        "stages": stages,
+        "other_ms": round(total_ms - sum(stages.values()), 1),
+    }
+    recent_slow_requests.append(entry)
+    logging.warning(f"Slow request {method} {path}: {total_ms:.0f} ms {stages}")
+    try:
+        slow_log().info(json.dumps(entry))
+    except OSError as e:
+        logging.error(f"Failed to write slow request log: {str(e)}")
+
+
+# Sampling profiler
+
+def profile_dir() -> Path:
+    path = Path(os.getenv("PROFILE_DIR", _data_dir() / "profiles"))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+class Sampler:
+    """Samples the Python stacks of every thread in this process.
+
+    ``folded()`` returns the collapsed-stack format read by flamegraph.pl and
+    speedscope. Only one sampler runs at a time per process.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> bool:
+        if not Sampler._lock.acquire(blocking=False):
+            return False
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.time() - self.started
+        Sampler._lock.release()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+    def save(self, label: str, profile_id: Optional[str] = None) -> str:
+        """Write the profile where any worker can serve it; returns its ID."""
+        profile_id = profile_id or uuid.uuid4().hex
+        directory = profile_dir()
+        (directory / f"{profile_id}.folded").write_text(self.folded())
+        (directory / f"{profile_id}.json").write_text(json.dumps({
+            "id": profile_id,
+            "description": label,
+            "started_at": self.started,
+            "duration": round(self.duration, 3),
+            "samples": self.samples,
+        }))
+        for old in sorted(directory.glob("*.json"), key=lambda path: path.stat().st_mtime)[:-KEEP_PROFILES]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".folded").unlink(missing_ok=True)
+        return profile_id
+
+
+async def profile_window(seconds: float) -> dict:
+    """Sample this worker for ``seconds`` and save the profile."""
+    seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+    sampler = Sampler()
+    if not sampler.start():
+        raise HTTPException(409, "A profile is already being captured")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        sampler.stop()
+    return {"id": sampler.save(f"window of {seconds:g}s"), "samples": sampler.samples}
+
+
+def list_profiles() -> List[dict]:
+    profiles = []
+    for path in profile_dir().glob("*.json"):
+        try:
+            profiles.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda profile: profile["started_at"], reverse=True)
+
+
+def profile_path(profile_id: str) -> Path:
+    path = profile_dir() / f"{profile_id}.folded"
+    if not profile_id.isalnum() or not path.exists():
+        raise HTTPException(404, "Profile not found")
+    return path
+
+
+class TimingMiddleware:
+    """Record per-stage timings for every request.
+
+    Adds a Server-Timing header, logs requests slower than SLOW_REQUEST_MS, and
+    when an admin sends ``X-Profile: 1`` samples the worker while the request
+    runs, returning the saved profile's ID in ``X-Profile-Id``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    @staticmethod
+    async def wants_profile(headers: Dict[bytes, bytes]) -> bool:
+        if headers.get(b"x-profile") not in (b"1", b"true"):
+            return False
+        try:
+            claims = await get_current_user(headers.get(b"authorization", b"").decode("latin-1"))
+        except HTTPException:
+            return False
+        return is_admin(claims)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        timings = Timings()
+        token = request_timings.set(timings)
+        headers = dict(scope.get("headers", []))
+        sampler = Sampler() if await self.wants_profile(headers) else None
+        if sampler and not sampler.start():
+            sampler = None
+        profile_id = uuid.uuid4().hex if sampler else None
+        status = None
+        finished = False
+
+        def finish():
+            # Runs when the response body is complete, so background tasks that
+            # run afterwards are not counted against the request
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            now = time.perf_counter()
+            timings.charge(now)
+            if sampler:
+                sampler.stop()
+                sampler.save(f"{scope['method']} {scope['path']}", profile_id)
+                logging.info(f"Saved profile {profile_id} for {scope['method']} {scope['path']}")
+            record_request(scope["method"], scope["path"], status, now - start, dict(timings.totals))
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                now = time.perf_counter()
+                timings.charge(now)
+                entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.totals.items()]
+                entries.append(f"total;dur={(now - start) * 1000:.1f}")
+                extra = [(b"server-timing", ", ".join(entries).encode())]
+                if profile_id:
+                    extra.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            request_timings.reset(token)
+            finish()
@@ -0,0 +1,110 @@
+import re
+from typing import Dict, List, Optional
+
+# Markdown emphasis and list numbering the model sometimes wraps field names in
+_DECORATION = re.compile(r"^(?:[\s*_#>-]|\d+[.)])+")
+_OPTION = re.compile(r"^([A-Z])[.)]\s*(.*)$")
+
+FLASHCARD_FIELDS = ("Front", "Back")
+QUIZ_FIELDS = ("Question Type", "Answer")
+
+
+def _field(line: str) -> Optional[str]:
+    """The field name of a ``Field: value`` line, lower-cased, or None."""
+    name, colon, _ = _DECORATION.sub("", line).replace("*", "").partition(":")
+    if not colon or not name or len(name) > 40:
+        return None
+    return name.strip().lower()
+
+
+class ItemParser:
+    """Incrementally split a ``Field: value`` formatted completion into items.
+
+    An item opens with its ``start`` field and is complete once the next item
+    starts, or once a blank line follows its ``end`` field, so each flashcard
+    or question can be used while the rest of the completion is still streaming.
+    Text before the first item is ignored.
+    """
+
+    def __init__(self, start: str, end: str):
+        self.start = start.lower()
+        self.end = end.lower()
+        self.text = ""
+        self._partial = ""
+        self._lines: List[str] = []
+        self._ended = False
+
+    def feed(self, text: str) -> List[str]:
+        """Consume more of the completion and return the items it completed."""
+        self.text += text
+        *lines, self._partial = (self._partial + text).split("\n")
+        items = []
+        for line in lines:
+            item = self._line(line)
+            if item:
+                items.append(item)
+        return items
+
+    def finish(self) -> List[str]:
+        """Return the last item once the completion has ended, if it got as far as its end field."""
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ""
+        item = self._take() if self._ended else None
+        return [item] if item else []
+
+    def _take(self) -> Optional[str]:
+        item = "\n".join(self._lines).strip()
+        self._lines = []
+        self._ended = False
+        return item or None
+
+    def _line(self, line: str) -> Optional[str]:
+        field = _field(line)
+        if field == self.start:
+            item = self._take() if self._ended else None
+            self._lines = [line.rstrip()]
+            return item
+        if not self._lines:
+            return None
+        if not line.strip():
+            return self._take() if self._ended else None
+        if field == self.end:
+            self._ended = True
+        self._lines.append(line.rstrip())
+        return None
+
+
+def split_items(text: str, fields: tuple) -> List[str]:
+    """All complete items in an already generated completion."""
+    parser = ItemParser(*fields)
+    return parser.feed(text) + parser.finish()
+
+
+def parse_item(item: str) -> Dict[str, object]:
+    """Turn an item's lines into a dict keyed by snake_case field name.
+
+    Lettered lines (``A. ...``) are collected under ``options``; other lines
+    without a field continue the previous field.
+    """
+    parsed: Dict[str, object] = {}
+    last = None
+    for line in item.splitlines():
+        stripped = line.strip()
+        option = _OPTION.match(stripped)
+        if option and last in ("options", "question"):
+            parsed.setdefault("options", []).append(option.group(2).strip())
+            last = "options"
+            continue
+        field = _field(stripped)
+        if field is not None:
+            key = re.sub(r"\W+", "_", field.split("(")[0].strip())
+            value = _DECORATION.sub("", stripped).replace("*", "").partition(":")[2].strip()
+            if key == "options":
+                parsed.setdefault("options", [])
+            else:
+                parsed[key] = value
+            last = key
+        elif last and last != "options":
+            parsed[last] = f"{parsed[last]}\n{stripped}".strip()
+    return parsed
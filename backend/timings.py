@@ -0,0 +1,48 @@
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Per-request stage timings. Kept free of app dependencies so the database
+# layer, benchmarks and extraction worker processes can import it cheaply.
+
+STAGES = ("db", "extract", "prompt-build", "llm", "serialize")
+
+
+class Timings:
+    # Time since ``mark`` belongs to ``stage``; nested spans pause the outer one
+    __slots__ = ("totals", "stage", "mark")
+
+    def __init__(self):
+        self.totals: Dict[str, float] = {}
+        self.stage: Optional[str] = None
+        self.mark = time.perf_counter()
+
+    def charge(self, now: float):
+        if self.stage is not None:
+            self.totals[self.stage] = self.totals.get(self.stage, 0.0) + now - self.mark
+        self.mark = now
+
+
+# The current request's Timings, set by profiling.TimingMiddleware
+request_timings: contextvars.ContextVar = contextvars.ContextVar("timings", default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """Charge the time spent inside the block to ``stage`` of the current request.
+
+    Spans are exclusive: time in a nested span is not also charged to the outer
+    one, so the stages of a request add up to at most its total time.
+    """
+    timings = request_timings.get()
+    if timings is None:
+        yield
+        return
+    timings.charge(time.perf_counter())
+    outer, timings.stage = timings.stage, stage
+    try:
+        yield
+    finally:
+        timings.charge(time.perf_counter())
+        timings.stage = outer
@@ -0,0 +1,291 @@
+import io
+import os
+import json
+import time
+import uuid
+import zipfile
+import logging
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+from database import get_db
+from dedup import band_buckets
+
+# Exports are a stream of JSON records, one per line: a header, then each folder
+# followed by everything that belongs to it. Each record is {"type": ..., "data": row}.
+# Rows keep their IDs so clients that remember folders, files or spaces keep working
+# after a move.
+FORMAT_VERSION = 1
+ZIP_MEMBER = "studybuddy-export.ndjson"
+# Streamed output is sent in chunks of about this size
+CHUNK_BYTES = 64 * 1024
+# Rows per executemany and per transaction when importing
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH_ROWS", "2000"))
+IMPORT_TRANSACTION_ROWS = int(os.getenv("IMPORT_TRANSACTION_ROWS", "50000"))
+# A batch is also written once its text and blobs reach this size
+IMPORT_BATCH_BYTES = int(os.getenv("IMPORT_BATCH_BYTES", str(16 * 1024 * 1024)))
+
+# Record type -> table
+TABLES = {
+    "folder": "folders",
+    "file": "files",
+    "space": "spaces",
+    "space_file": "space_files",
+    "message": "chat_messages",
+    "artifact": "generated_artifacts",
+}
+# Tables whose inserted rows are counted, by record type
+COUNTED = {**{table: record_type for record_type, table in TABLES.items()}, "file_signatures": "signature"}
+# Columns holding folder, file or space IDs, rewritten when a folder is imported as a copy
+ID_COLUMNS = ("id", "folder_id", "file_id", "space_id", "duplicate_of")
+# Rows fetched at a time; rows carrying document text can be megabytes each,
+# so those are fetched one by one to keep memory flat
+FETCH_ROWS = 500
+
+
+def _rows(conn, record_type: str, sql: str, params: tuple, fetch_rows: int = FETCH_ROWS) -> Iterator[dict]:
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(fetch_rows)
+        if not rows:
+            return
+        for row in rows:
+            yield {"type": record_type, "data": dict(row)}
+
+
+def iter_records(user_id: Optional[str] = None, folder_id: Optional[str] = None) -> Iterator[dict]:
+    """Yield the export records for one folder or for every folder of a user.
+
+    Reads run in one transaction, so the export is a consistent snapshot even
+    while the user keeps writing.
+    """
+    with get_db() as conn:
+        conn.execute("BEGIN")
+        if folder_id is not None:
+            folders = conn.execute("SELECT * FROM folders WHERE id = ?", (folder_id,)).fetchall()
+        else:
+            folders = conn.execute("SELECT * FROM folders WHERE user_id = ?", (user_id,)).fetchall()
+
+        yield {"type": "header", "version": FORMAT_VERSION, "exported_at": time.time(), "folders": len(folders)}
+        for folder in folders:
+            yield {"type": "folder", "data": dict(folder)}
+            params = (folder["id"],)
+            yield from _rows(conn, "file", "SELECT * FROM files WHERE folder_id = ?", params, fetch_rows=1)
+            for row in conn.execute("SELECT file_id, signature FROM file_signatures WHERE folder_id = ?", params):
+                yield {"type": "signature", "data": {"file_id": row["file_id"], "signature": row["signature"].hex()}}
+            yield from _rows(
+                conn, "artifact",
+                "SELECT * FROM generated_artifacts WHERE file_id IN (SELECT id FROM files WHERE folder_id = ?)",
+                params, fetch_rows=1
+            )
+
+            spaces = [row["id"] for row in conn.execute("SELECT id FROM spaces WHERE folder_id = ?", params)]
+            yield from _rows(conn, "space", "SELECT * FROM spaces WHERE folder_id = ?", params)
+            for space_id in spaces:
+                yield from _rows(conn, "space_file", "SELECT * FROM space_files WHERE space_id = ?", (space_id,))
+                # Primary-key range scan: messages are clustered by space
+                yield from _rows(conn, "message", "SELECT * FROM chat_messages WHERE space_id = ? ORDER BY id", (space_id,))
+        conn.rollback()
+
+
+def _chunks(lines: Iterable[bytes]) -> Iterator[bytes]:
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def iter_ndjson(records: Iterable[dict]) -> Iterator[bytes]:
+    return _chunks(json.dumps(record, default=str).encode() + b"\n" for record in records)
+
+
+class _StreamSink(io.RawIOBase):
+    # Write-only, unseekable file object; zipfile then writes data descriptors
+    # so the archive can be streamed without going back to patch headers
+    def __init__(self):
+        self.pending: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.pending.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.pending)
+        self.pending.clear()
+        return data
+
+
+def iter_zip(records: Iterable[dict]) -> Iterator[bytes]:
+    """Stream a ZIP archive holding the NDJSON export as a single deflated member."""
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(ZIP_MEMBER, "w", force_zip64=True) as member:
+            for chunk in iter_ndjson(records):
+                member.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+    yield sink.drain()
+
+
+def open_import(upload: IO[bytes]) -> IO[bytes]:
+    """The NDJSON stream inside an uploaded export, which may be a ZIP archive."""
+    if zipfile.is_zipfile(upload):
+        upload.seek(0)
+        archive = zipfile.ZipFile(upload)
+        names = [name for name in archive.namelist() if name.endswith(".ndjson")]
+        if not names:
+            raise ValueError("ZIP archive does not contain an .ndjson export")
+        return archive.open(names[0])
+    upload.seek(0)
+    return upload
+
+
+class _Importer:
+    def __init__(self, conn, user_id: Optional[str]):
+        self.conn = conn
+        self.user_id = user_id
+        self.pending: Dict[Tuple[str, tuple], List[tuple]] = {}
+        self.pending_rows = 0
+        self.pending_bytes = 0
+        self.uncommitted = 0
+        self.read: Dict[str, int] = {}
+        self.counts: Dict[str, int] = {}
+        self.folder_ids: List[str] = []
+        self._new_ids: Dict[str, str] = {}
+        self._columns = {
+            table: {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for table in TABLES.values()
+        }
+        self._signature_folders: Dict[str, str] = {}
+
+    def add(self, record: dict):
+        record_type = record.get("type")
+        if record_type == "header":
+            if record.get("version", FORMAT_VERSION) > FORMAT_VERSION:
+                raise ValueError(f"Unsupported export version {record['version']}")
+            return
+        if not isinstance(record.get("data"), dict):
+            raise ValueError(f"Record of type {record_type!r} has no data")
+        row = record["data"]
+        if record_type != "signature" and record_type not in TABLES:
+            raise ValueError(f"Unknown record type: {record_type!r}")
+        self._remap(record_type, row)
+        self.read[record_type] = self.read.get(record_type, 0) + 1
+        if record_type == "signature":
+            self._add_signature(row)
+            return
+        if record_type == "file":
+            self._signature_folders[row["id"]] = row["folder_id"]
+        table = TABLES[record_type]
+        # Columns unknown to this instance (a newer export) are dropped
+        columns = tuple(column for column in row if column in self._columns[table])
+        values = tuple(row[column] for column in columns)
+        if record_type == "folder":
+            # Inserted one at a time so the folders actually created can be reported
+            cursor = self.conn.execute(
+                f"INSERT OR IGNORE INTO folders ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                values
+            )
+            if cursor.rowcount:
+                self.folder_ids.append(row["id"])
+                self.counts["folder"] = self.counts.get("folder", 0) + 1
+        else:
+            self._queue(table, columns, values)
+
+    def _remap(self, record_type: str, row: dict):
+        if record_type == "folder" and self.user_id is not None:
+            row["user_id"] = self.user_id
+            owner = self.conn.execute("SELECT user_id FROM folders WHERE id = ?", (row["id"],)).fetchone()
+            if owner and owner["user_id"] != self.user_id:
+                # A copy into another user of this instance: the folder and
+                # everything in it get new IDs instead of colliding with the original
+                self._new_ids[row["id"]] = self._copy_id(row["id"])
+        elif record_type in ("file", "space") and row.get("folder_id") in self._new_ids:
+            self._new_ids[row["id"]] = self._copy_id(row["id"])
+        if self._new_ids:
+            for column in ID_COLUMNS:
+                if row.get(column) in self._new_ids:
+                    row[column] = self._new_ids[row[column]]
+
+    def _copy_id(self, id: str) -> str:
+        # Derived from the target user, so importing the same export again stays a no-op
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"studybuddy:{self.user_id}:{id}"))
+
+    def _add_signature(self, row: dict):
+        file_id = row["file_id"]
+        folder_id = self._signature_folders.get(file_id)
+        if folder_id is None:
+            return
+        signature = bytes.fromhex(row["signature"])
+        self._queue("file_signatures", ("file_id", "folder_id", "signature"), (file_id, folder_id, signature))
+        for band, bucket in band_buckets(signature):
+            self._queue("lsh_buckets", ("folder_id", "band", "bucket", "file_id"), (folder_id, band, bucket, file_id))
+
+    def _queue(self, table: str, columns: tuple, values: tuple):
+        self.pending.setdefault((table, columns), []).append(values)
+        self.pending_rows += 1
+        self.pending_bytes += sum(len(value) for value in values if isinstance(value, (str, bytes)))
+        if self.pending_rows >= IMPORT_BATCH or self.pending_bytes >= IMPORT_BATCH_BYTES:
+            self.flush()
+
+    def flush(self, final: bool = False):
+        for (table, columns), rows in self.pending.items():
+            # Existing rows win, so re-importing the same export is harmless
+            before = self.conn.total_changes
+            self.conn.executemany(
+                f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                rows
+            )
+            if table in COUNTED:
+                record_type = COUNTED[table]
+                self.counts[record_type] = self.counts.get(record_type, 0) + self.conn.total_changes - before
+        self.uncommitted += self.pending_rows
+        self.pending.clear()
+        self.pending_rows = 0
+        self.pending_bytes = 0
+        if final or self.uncommitted >= IMPORT_TRANSACTION_ROWS:
+            self.conn.commit()
+            self.uncommitted = 0
+
+
+def import_records(stream: IO[bytes], user_id: Optional[str] = None) -> dict:
+    """Insert an NDJSON export in large batched transactions.
+
+    Records are read one line at a time, so memory stays flat however large the
+    export is. With ``user_id`` every imported folder is assigned to that user;
+    folders that already exist under another user are imported as copies with
+    new IDs. Rows that already exist are skipped, and ``counts`` reports only
+    the rows inserted.
+    """
+    with get_db() as conn:
+        importer = _Importer(conn, user_id)
+        try:
+            for line_number, line in enumerate(io.TextIOWrapper(stream, encoding="utf-8"), start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    raise ValueError(f"Line {line_number} is not valid JSON") from None
+                importer.add(record)
+            importer.flush(final=True)
+        except Exception:
+            # Batches already committed stay; the import can be re-run safely
+            conn.rollback()
+            raise
+    skipped = {
+        record_type: read - importer.counts.get(record_type, 0)
+        for record_type, read in importer.read.items()
+        if read > importer.counts.get(record_type, 0)
+    }
+    logging.info(f"Imported {importer.counts} into {len(importer.folder_ids)} new folder(s), skipped {skipped}")
+    counts = {record_type: count for record_type, count in importer.counts.items() if count}
+    return {"folders": importer.folder_ids, "counts": counts, "skipped": skipped}
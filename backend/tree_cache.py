@@ -0,0 +1,248 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import cache_sync
+from database import get_db
+
+# Upper bound on the (estimated) size of everything cached
+MAX_BYTES = int(os.getenv("TREE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+def _size(value) -> int:
+    # Serialized size: close to what the entry costs and to what a hit saves sending
+    return len(json.dumps(value, default=str))
+
+
+class TreeCache:
+    """LRU of the dashboard's folder, space and resource listings, bounded by size.
+
+    Entries are keyed by ``(kind, id)``:
+
+    - ``("folders", user_id)``: a user's folders with their spaces, as ``GET /folders``
+    - ``("space", space_id)``: one space, as ``GET /spaces/{id}``
+    - ``("resources", folder_id)``: a folder's files, as ``GET /folders/{id}/resources``
+
+    Cached values are never mutated; writes replace them, so a value handed to a
+    response stays consistent while it is serialized.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (kind, id) -> (value, size, index refs)
+        # Reverse indexes from the IDs an invalidation carries to the entries holding
+        # them; each entry removes its own refs when it leaves the cache
+        self._folder_users: Dict[str, str] = {}
+        self._space_users: Dict[str, str] = {}
+        self._file_folders: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, key: str):
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((kind, key))
+            self.hits += 1
+            return entry[0]
+
+    def put(self, kind: str, key: str, value):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._set(kind, key, value, size)
+
+    def _set(self, kind: str, key: str, value, size: int):
+        self._discard((kind, key))
+        self._entries[(kind, key)] = (value, size, self._index(kind, key, value))
+        self.size += size
+        while self.size > self.max_bytes:
+            self._remove(*self._entries.popitem(last=False))
+
+    def _index(self, kind: str, key: str, value) -> list:
+        refs = []
+        if kind == "folders":
+            for folder in value:
+                refs.append((self._folder_users, folder["id"]))
+                refs.extend((self._space_users, space["id"]) for space in folder["spaces"])
+        elif kind == "resources":
+            refs.extend((self._file_folders, resource["id"]) for resource in value)
+        for index, id in refs:
+            index[id] = key
+        return refs
+
+    def _remove(self, entry_key: tuple, entry: tuple):
+        _, size, refs = entry
+        self.size -= size
+        for index, id in refs:
+            # Unless a newer entry has claimed the ID since
+            if index.get(id) == entry_key[1]:
+                del index[id]
+
+    def _discard(self, entry_key: tuple):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._remove(entry_key, entry)
+
+    # Write-through updates for writes made by this worker. Entries that are not
+    # cached are left alone; the next read loads them.
+
+    def add_folder(self, user_id: str, folder: dict):
+        with self._lock:
+            entry = self._entries.get(("folders", user_id))
+            if entry is not None:
+                folders = entry[0] + [{**folder, "spaces": []}]
+                self._set("folders", user_id, folders, _size(folders))
+
+    def put_space(self, space: dict):
+        """Add or replace a space in its own entry and in its user's folder list."""
+        listed = {"id": space["id"], "type": space["type"], "name": space["name"], "notes": space["notes"]}
+        size = _size(space)
+        with self._lock:
+            if size <= self.max_bytes:
+                self._set("space", space["id"], space, size)
+            user_id = self._folder_users.get(space["folder_id"])
+            entry = self._entries.get(("folders", user_id))
+            if entry is None:
+                return
+            folders = []
+            for folder in entry[0]:
+                if folder["id"] == space["folder_id"]:
+                    spaces = folder["spaces"]
+                    if any(other["id"] == space["id"] for other in spaces):
+                        spaces = [listed if other["id"] == space["id"] else other for other in spaces]
+                    else:
+                        spaces = spaces + [listed]
+                    folder = {**folder, "spaces": spaces}
+                folders.append(folder)
+            self._set("folders", user_id, folders, _size(folders))
+
+    # Invalidation handlers, called for writes made by any worker
+
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            self._discard(("folders", user_id))
+
+    def invalidate_folder(self, folder_id: str):
+        with self._lock:
+            self._discard(("resources", folder_id))
+            self._discard(("folders", self._folder_users.get(folder_id)))
+            for entry_key in [
+                entry_key for entry_key, (value, _, _) in self._entries.items()
+                if entry_key[0] == "space" and value["folder_id"] == folder_id
+            ]:
+                self._discard(entry_key)
+
+    def invalidate_resources(self, folder_id: str):
+        with self._lock:
+            self._discard(("resources", folder_id))
+
+    def invalidate_space(self, space_id: str):
+        with self._lock:
+            self._discard(("space", space_id))
+            self._discard(("folders", self._space_users.get(space_id)))
+
+    def invalidate_file(self, file_id: str):
+        with self._lock:
+            self._discard(("resources", self._file_folders.get(file_id)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._folder_users.clear()
+            self._space_users.clear()
+            self._file_folders.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "indexed_ids": len(self._folder_users) + len(self._space_users) + len(self._file_folders),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+tree_cache = TreeCache()
+cache_sync.register("user", tree_cache.invalidate_user)
+cache_sync.register("folder", tree_cache.invalidate_folder)
+cache_sync.register("resources", tree_cache.invalidate_resources)
+cache_sync.register("space", tree_cache.invalidate_space)
+cache_sync.register("file", tree_cache.invalidate_file)
+cache_sync.register_clear(tree_cache.clear)
+
+
+def get_folders(user_id: str) -> List[dict]:
+    """A user's folders, each with its spaces."""
+    cache_sync.sync()
+    folders = tree_cache.get("folders", user_id)
+    if folders is not None:
+        return folders
+
+    with get_db() as conn:
+        rows = conn.execute(
+            "SELECT id, name FROM folders WHERE user_id = ?",
+            (user_id,)
+        ).fetchall()
+        folders = []
+        for folder in rows:
+            spaces = conn.execute(
+                "SELECT id, type, name, notes FROM spaces WHERE folder_id = ?",
+                (folder["id"],)
+            ).fetchall()
+            folders.append({
+                "id": folder["id"],
+                "name": folder["name"],
+                "spaces": [dict(space) for space in spaces]
+            })
+    tree_cache.put("folders", user_id, folders)
+    return folders
+
+
+def get_space(space_id: str) -> Optional[dict]:
+    cache_sync.sync()
+    space = tree_cache.get("space", space_id)
+    if space is not None:
+        return space
+
+    with get_db() as conn:
+        row = conn.execute(
+            "SELECT id, type, name, folder_id, notes FROM spaces WHERE id = ?",
+            (space_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    space = dict(row)
+    tree_cache.put("space", space_id, space)
+    return space
+
+
+def get_resources(folder_id: str) -> Optional[List[dict]]:
+    """A folder's files with their processing status, or None if the folder does not exist."""
+    cache_sync.sync()
+    resources = tree_cache.get("resources", folder_id)
+    if resources is not None:
+        return resources
+
+    with get_db() as conn:
+        if not conn.execute("SELECT id FROM folders WHERE id = ?", (folder_id,)).fetchone():
+            return None
+        rows = conn.execute(
+            "SELECT id, name, status FROM files WHERE folder_id = ?",
+            (folder_id,)
+        ).fetchall()
+    resources = [dict(row) for row in rows]
+    tree_cache.put("resources", folder_id, resources)
+    return resources
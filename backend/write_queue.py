@@ -0,0 +1,154 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import List, Optional, Sequence, Tuple
+
+from database import connect
+from timings import span
+
+# A batch is committed once it holds this many writes or its oldest write is this old
+MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "256"))
+FLUSH_INTERVAL = float(os.getenv("WRITE_QUEUE_FLUSH_MS", "5")) / 1000
+# Acknowledged writes are fsynced; group commit spreads that cost over the batch
+SYNCHRONOUS = os.getenv("WRITE_QUEUE_SYNCHRONOUS", "FULL")
+
+_STOP = object()
+
+
+class WriteQueue:
+    """Write-behind queue that applies small writes from all requests in group commits.
+
+    A single writer thread owns one connection. Each submitted statement gets a
+    Future that resolves once the transaction containing it is committed, or
+    fails with the statement's own error; one bad write does not fail the batch.
+    """
+
+    def __init__(self, max_batch: int = MAX_BATCH, flush_interval: float = FLUSH_INTERVAL):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.batches = 0
+        self.writes = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, sql: str, params: Sequence = ()) -> Future:
+        future = Future()
+        with self._lock:
+            # Also restarts a writer thread that died, so queued writes never hang
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+                self._thread.start()
+            self._queue.put((sql, params, future))
+        return future
+
+    async def write(self, sql: str, params: Sequence = ()):
+        """Queue a write and wait until it is durably committed.
+
+        Cancelling the caller does not cancel the write: once queued it is
+        committed as usual, so a row is never committed but reported as lost.
+        """
+        with span("db"):
+            return await asyncio.shield(asyncio.wrap_future(self.submit(sql, params)))
+
+    def close(self, timeout: Optional[float] = None):
+        """Commit everything already queued, then stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _next_batch(self) -> Tuple[List[tuple], bool]:
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+
+        batch = [first]
+        stop = False
+        try:
+            # Writes that arrive within the flush window join the same commit
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+        except queue.Empty:
+            pass
+        return batch, stop
+
+    def _run(self):
+        conn = connect(SYNCHRONOUS)
+        try:
+            while True:
+                batch, stop = self._next_batch()
+                if batch:
+                    self._commit(conn, batch)
+                if stop:
+                    # Anything still queued after the stop marker is committed too
+                    remaining = []
+                    while not self._queue.empty():
+                        item = self._queue.get_nowait()
+                        if item is not _STOP:
+                            remaining.append(item)
+                    if remaining:
+                        self._commit(conn, remaining)
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch: List[tuple]):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for sql, params, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    # Cancelled while queued
+                    continue
+                # A savepoint per write isolates failures without aborting the batch
+                conn.execute("SAVEPOINT write")
+                try:
+                    cursor = conn.execute(sql, params)
+                    conn.execute("RELEASE write")
+                    results.append((future, cursor.rowcount, None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    results.append((future, None, e))
+            conn.commit()
+        except Exception as e:
+            logging.error(f"Write queue commit failed: {str(e)}")
+            conn.rollback()
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.writes += len(results)
+        for future, rowcount, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(rowcount)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "writes": self.writes,
+            "pending": self._queue.qsize(),
+            "avg_batch": self.writes / self.batches if self.batches else 0.0,
+        }
+
+
+write_queue = WriteQueue()